@@ -2,7 +2,6 @@ param([switch]$NoMinify)
 
 $files = @(
     "../src/main.js",
-    "../src/sw.js",
     "../src/modules/api.js",
     "../src/modules/highlights.js", 
     "../src/modules/hotkeys.js",
@@ -12,8 +11,7 @@ $files = @(
     "../src/modules/settings.js",
     "../src/modules/state.js",
     "../src/modules/strongs.js",
-    "../src/modules/ui.js",
-    "../src/sw.js"
+    "../src/modules/ui.js"
 )
 
 Write-Host "Checking files..." -ForegroundColor Yellow
@@ -155,5 +153,6 @@ if (!$NoMinify) {
 
 Write-Host "`nBackups: ../src/modules/" -ForegroundColor Gray
 Write-Host "UTF-8 preserved" -ForegroundColor Green
+Write-Host "sw.js is generated by build-sw.py - run it after the other builders" -ForegroundColor Gray
 
 Write-Host "`nUse: .\Build-JS.ps1 [-NoMinify]" -ForegroundColor Gray
@@ -0,0 +1,262 @@
+# Local chapter audio cache for the Provinent dev HTTPS servers
+# Fronts the KJV chapter MP3 origin (a remote URL or a local directory),
+# keeps a copy of every file on disk and serves byte ranges for seeking.
+
+import os
+import re
+import shutil
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+# URL prefix served by the dev server; mirrors the openbible.com layout so
+# getKJVAudioLink() only needs a different base URL to use the cache
+AUDIO_ROUTE = "/audio/kjv/"
+
+# KJV_<book number>_<book code>_<chapter>.mp3, as built by getKJVAudioLink()
+AUDIO_FILE_PATTERN = re.compile(r'^KJV_(\d{2})_(\w{3})_(\d{3})\.mp3$')
+
+# Book codes and chapter counts in canonical order (see KJV_BOOK_MAP in
+# src/modules/api.js and CHAPTER_COUNTS in src/modules/state.js)
+KJV_BOOKS = [
+    ('01_Gen', 50), ('02_Exo', 40), ('03_Lev', 27), ('04_Num', 36), ('05_Deu', 34),
+    ('06_Jos', 24), ('07_Jdg', 21), ('08_Rut', 4), ('09_1Sa', 31), ('10_2Sa', 24),
+    ('11_1Ki', 22), ('12_2Ki', 25), ('13_1Ch', 29), ('14_2Ch', 36), ('15_Ezr', 10),
+    ('16_Neh', 13), ('17_Est', 10), ('18_Job', 42), ('19_Psa', 150), ('20_Pro', 31),
+    ('21_Ecc', 12), ('22_Sng', 8), ('23_Isa', 66), ('24_Jer', 52), ('25_Lam', 5),
+    ('26_Eze', 48), ('27_Dan', 12), ('28_Hos', 14), ('29_Joe', 3), ('30_Amo', 9),
+    ('31_Oba', 1), ('32_Jon', 4), ('33_Mic', 7), ('34_Nah', 3), ('35_Hab', 3),
+    ('36_Zep', 3), ('37_Hag', 2), ('38_Zec', 14), ('39_Mal', 4), ('40_Mat', 28),
+    ('41_Mar', 16), ('42_Luk', 24), ('43_Joh', 21), ('44_Act', 28), ('45_Rom', 16),
+    ('46_1Co', 16), ('47_2Co', 13), ('48_Gal', 6), ('49_Eph', 6), ('50_Php', 4),
+    ('51_Col', 4), ('52_1Th', 5), ('53_2Th', 3), ('54_1Ti', 6), ('55_2Ti', 4),
+    ('56_Tit', 3), ('57_Phm', 1), ('58_Heb', 13), ('59_Jas', 5), ('60_1Pe', 5),
+    ('61_2Pe', 3), ('62_1Jn', 5), ('63_2Jn', 1), ('64_3Jn', 1), ('65_Jud', 1),
+    ('66_Rev', 22),
+]
+
+FETCH_TIMEOUT = 30  # seconds
+CHUNK_SIZE = 64 * 1024
+
+
+def next_chapter_file(file_name):
+    """Return the file name of the chapter after file_name, or None at Revelation 22"""
+    match = AUDIO_FILE_PATTERN.match(file_name)
+    if not match:
+        return None
+
+    book_index = int(match.group(1)) - 1
+    chapter = int(match.group(3))
+    if not 0 <= book_index < len(KJV_BOOKS):
+        return None
+
+    if chapter < KJV_BOOKS[book_index][1]:
+        return f"KJV_{KJV_BOOKS[book_index][0]}_{chapter + 1:03d}.mp3"
+    if book_index + 1 < len(KJV_BOOKS):
+        return f"KJV_{KJV_BOOKS[book_index + 1][0]}_001.mp3"
+    return None
+
+
+def parse_range(header, size):
+    """Parse a Range header into an inclusive (start, end) tuple.
+
+    Returns None when the whole file should be sent (no header, a non-byte
+    unit, or a multi-range request, which RFC 9110 allows us to ignore).
+    Raises ValueError when the range cannot be satisfied (416).
+    """
+    if not header:
+        return None
+
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        raise ValueError(f"Malformed range: {header}")
+
+    first, last = first.strip(), last.strip()
+    if not (first.isdigit() or first == '') or not (last.isdigit() or last == ''):
+        raise ValueError(f"Malformed range: {header}")
+
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last) if last else 0
+        if length <= 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range: {header}")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+
+    if start >= size or end < start:
+        raise ValueError(f"Unsatisfiable range: {header}")
+
+    return start, min(end, size - 1)
+
+
+class OriginDownload:
+    """A cache miss being copied from a remote origin.
+
+    Iterating yields the file's bytes as they arrive and writes them to a
+    .part file, which is moved into the cache once the whole file is in;
+    a response shorter than its Content-Length raises ConnectionError.
+    Closing releases the per-file lock and drops an unfinished .part file.
+    """
+
+    def __init__(self, response, dest, lock):
+        self.response = response
+        self.dest = dest
+        self.lock = lock
+        # Unique per process and thread, as pre-forked workers share the cache
+        self.partial = dest.with_name(f"{dest.name}.{os.getpid()}-{threading.get_ident()}.part")
+        self.complete = False
+        length = response.headers.get('Content-Length')
+        self.size = int(length) if length and length.isdigit() else None
+
+    def __iter__(self):
+        received = 0
+        with open(self.partial, 'wb') as f:
+            for chunk in iter(lambda: self.response.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+                received += len(chunk)
+                yield chunk
+        # http.client ends a short response quietly; never cache a truncated file
+        if self.size is not None and received != self.size:
+            raise ConnectionError(f"origin sent {received} of {self.size} bytes")
+        # Rename into place so readers never see a half-written file
+        os.replace(self.partial, self.dest)
+        self.complete = True
+
+    def close(self):
+        self.response.close()
+        if not self.complete:
+            self.partial.unlink(missing_ok=True)
+        self.lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AudioCache:
+    """On-disk cache of chapter MP3s in front of a remote or local origin"""
+
+    def __init__(self, origin, cache_dir, prefetch=True):
+        self.origin = str(origin).rstrip('/')
+        self.is_remote = self.origin.startswith(('http://', 'https://'))
+        self.cache_dir = Path(cache_dir)
+        self.prefetch_enabled = prefetch
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _lock_for(self, file_name):
+        with self._locks_guard:
+            return self._locks.setdefault(file_name, threading.Lock())
+
+    def cached_path(self, file_name):
+        """Return the cache path for file_name if it has already been stored"""
+        path = self.cache_dir / file_name
+        return path if path.is_file() else None
+
+    def get(self, file_name):
+        """Return the local path of file_name, fetching it from the origin if needed.
+
+        Returns None if the origin does not have the file.
+        """
+        if not AUDIO_FILE_PATTERN.match(file_name):
+            return None
+
+        path = self.cached_path(file_name)
+        if path:
+            return path
+
+        if self.is_remote:
+            download = self.download(file_name)
+            if not isinstance(download, OriginDownload):
+                return download
+            with download:
+                for _ in download:
+                    pass
+            return download.dest
+
+        # One copy per file, even if several requests arrive at once
+        with self._lock_for(file_name):
+            path = self.cached_path(file_name)
+            if path:
+                return path
+            return self._copy_local(file_name)
+
+    def download(self, file_name):
+        """Start copying file_name from a remote origin, for serving a miss as it arrives.
+
+        Returns an OriginDownload to iterate and close, the cached path if
+        another request stored the file meanwhile, or None if the origin
+        does not have it.
+        """
+        if not AUDIO_FILE_PATTERN.match(file_name):
+            return None
+
+        # One download per file, even if several requests arrive at once
+        lock = self._lock_for(file_name)
+        lock.acquire()
+        try:
+            path = self.cached_path(file_name)
+            if path:
+                lock.release()
+                return path
+
+            request = urllib.request.Request(
+                f"{self.origin}/{file_name}",
+                headers={'User-Agent': 'provinent-dev-server'},
+            )
+            response = urllib.request.urlopen(request, timeout=FETCH_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            lock.release()
+            if e.code == 404:
+                return None
+            raise
+        except BaseException:
+            lock.release()
+            raise
+
+        return OriginDownload(response, self.cache_dir / file_name, lock)
+
+    def _copy_local(self, file_name):
+        """Copy file_name from a local origin directory into the cache"""
+        source = Path(self.origin) / file_name
+        if not source.is_file():
+            return None
+
+        dest = self.cache_dir / file_name
+        partial = dest.with_name(f"{file_name}.{os.getpid()}-{threading.get_ident()}.part")
+        try:
+            shutil.copyfile(source, partial)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+        # Rename into place so readers never see a half-written file
+        os.replace(partial, dest)
+        return dest
+
+    def prefetch_next(self, file_name):
+        """Fetch the following chapter in the background"""
+        if not self.prefetch_enabled:
+            return
+
+        next_file = next_chapter_file(file_name)
+        if not next_file or self.cached_path(next_file):
+            return
+
+        def worker():
+            try:
+                self.get(next_file)
+            except Exception as e:
+                print(f"Audio prefetch failed for {next_file}: {e}")
+
+        threading.Thread(target=worker, name=f"prefetch-{next_file}", daemon=True).start()
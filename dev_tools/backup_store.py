@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Content-addressed backup store for the Provinent Scripture Study builders
+Each unique build output is stored once under ../backups/objects by SHA-256;
+index.json records which output had which content when.
+Usage: python3 backup_store.py [--list] [--restore NAME [--hash HASH]]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BACKUP_ROOT = "../backups"
+INDEX_SCHEMA = 1
+DEFAULT_KEEP = 10  # Backups kept per output
+
+def add_backup_arguments(parser):
+    """Add the backup retention options shared by the builders"""
+    parser.add_argument('--backup-keep', type=int, default=DEFAULT_KEEP,
+                        help=f'Backups kept per output (default: {DEFAULT_KEEP})')
+    parser.add_argument('--backup-max-age', type=float, default=None, metavar='DAYS',
+                        help='Drop backups older than this many days')
+
+def expected_bytes(content):
+    """Bytes that open(path, 'w', encoding='utf-8') would write for content"""
+    return content.replace('\n', os.linesep).encode('utf-8')
+
+def current_umask():
+    """Return the process umask (os.umask can only read it by setting it)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def write_text_atomic(path, content):
+    """Write content to path unless it already holds it; returns True if written.
+
+    The new file is renamed into place with the old file's permissions,
+    or the umask default for a new file (mkstemp alone would leave 0600).
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == expected_bytes(content):
+                return False
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~current_umask()
+
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CorruptBackup(Exception):
+    """A stored blob is missing or no longer matches its SHA-256"""
+
+    def __init__(self, name, digest):
+        super().__init__(f"Backup {digest[:12]} of {name} is missing or corrupt and was removed")
+        self.name = name
+        self.digest = digest
+
+class BackupStore:
+    """Deduplicated backups of build outputs with count and age retention"""
+
+    def __init__(self, root=BACKUP_ROOT, keep=DEFAULT_KEEP, max_age_days=None):
+        self.root = root
+        self.keep = keep
+        self.max_age_days = max_age_days
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        self.entries = []
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', [])
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(keep=args.backup_keep, max_age_days=args.backup_max_age)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def latest(self, name):
+        """Return the newest entry for name, or None"""
+        for entry in reversed(self.entries):
+            if entry['name'] == name:
+                return entry
+        return None
+
+    def backup(self, path, name):
+        """Back up the file at path as name.
+
+        Returns the entry added, or None if there is no file or its content
+        is already the newest backup of name.
+        """
+        if not os.path.isfile(path):
+            return None
+
+        digest = hash_file(path)
+        latest = self.latest(name)
+        if latest and latest['hash'] == digest:
+            return None
+
+        blob = self.object_path(digest)
+        if not os.path.exists(blob):
+            # Copy rather than hardlink: the PowerShell builders overwrite
+            # outputs in place, which would change a linked blob too
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            temp_path = blob + '.tmp'
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, blob)
+
+        entry = {
+            'name': name,
+            'hash': digest,
+            'size': os.path.getsize(blob),
+            'time': datetime.now().isoformat(timespec='seconds')
+        }
+        self.entries.append(entry)
+        return entry
+
+    def prune(self):
+        """Apply the retention policy, delete unreferenced blobs and save the index.
+
+        Returns the number of blobs removed.
+        """
+        cutoff = None
+        if self.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat(timespec='seconds')
+
+        kept = []
+        per_name = {}
+        for entry in reversed(self.entries):
+            count = per_name.get(entry['name'], 0)
+            if count >= self.keep or (cutoff and entry['time'] < cutoff):
+                continue
+            per_name[entry['name']] = count + 1
+            kept.append(entry)
+        kept.reverse()
+        self.entries = kept
+
+        referenced = {entry['hash'] for entry in self.entries}
+        removed = 0
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for rest in os.listdir(prefix_dir):
+                    if prefix + rest not in referenced:
+                        os.remove(os.path.join(prefix_dir, rest))
+                        removed += 1
+                if not os.listdir(prefix_dir):
+                    os.rmdir(prefix_dir)
+
+        self.save()
+        return removed
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        write_text_atomic(self.index_path, json.dumps(
+            {'schema': INDEX_SCHEMA, 'entries': self.entries}, indent=2) + '\n')
+
+    def restore(self, name, dest, digest=None):
+        """Copy a backup of name (the newest, or the one with digest) to dest.
+
+        Raises CorruptBackup, and drops the blob, if its content no longer
+        matches its hash.
+        """
+        matches = [e for e in self.entries if e['name'] == name and (digest is None or e['hash'].startswith(digest))]
+        if not matches:
+            return None
+        entry = matches[-1]
+        blob = self.object_path(entry['hash'])
+        if not os.path.isfile(blob) or hash_file(blob) != entry['hash']:
+            if os.path.exists(blob):
+                os.remove(blob)
+            self.entries = [e for e in self.entries if e['hash'] != entry['hash']]
+            self.save()
+            raise CorruptBackup(name, entry['hash'])
+
+        # Copy beside dest and rename, so a reader never sees a partial file
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        temp_path = dest + '.restore'
+        shutil.copyfile(blob, temp_path)
+        os.replace(temp_path, dest)
+        return entry
+
+def main():
+    parser = argparse.ArgumentParser(description='Build Output Backup Store')
+    parser.add_argument('--list', action='store_true', help='List stored backups')
+    parser.add_argument('--restore', metavar='NAME', help='Restore NAME (e.g. modules/api.js) into ../www')
+    parser.add_argument('--hash', help='Hash prefix of the backup to restore (default: newest)')
+    args = parser.parse_args()
+
+    store = BackupStore()
+
+    if args.restore:
+        dest = os.path.join("../www", args.restore)
+        try:
+            entry = store.restore(args.restore, dest, args.hash)
+        except CorruptBackup as e:
+            print(f"\033[31m{e}\033[0m")
+            sys.exit(1)
+        if not entry:
+            print(f"\033[31mNo backup found for: {args.restore}\033[0m")
+            sys.exit(1)
+        print(f"\033[32mRestored {args.restore} ({entry['hash'][:12]}, {entry['time']}) to {dest}\033[0m")
+        return
+
+    unique = {entry['hash']: entry['size'] for entry in store.entries}
+    print("\033[33mBackups:\033[0m")
+    for entry in store.entries:
+        print(f"  \033[36m{entry['name']}\033[0m {entry['hash'][:12]} {entry['time']} {round(entry['size'] / 1024, 1)}KB")
+    print(f"\033[90m{len(store.entries)} backups, {len(unique)} unique blobs, "
+          f"{round(sum(unique.values()) / 1024, 1)} KB stored\033[0m")
+
+if __name__ == "__main__":
+    main()
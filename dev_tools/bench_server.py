@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the dev HTTPS server's --workers mode
+Starts https_server.py with 1, 2, 4 and 8 workers in turn and loads it with
+client processes requesting every file in the built www/ tree.
+Usage: python3 bench_server.py [--workers 1,2,4,8] [--duration 10] [--clients N]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import signal
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEV_TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(DEV_TOOLS_DIR)
+
+def collect_paths(web_root):
+    """Return the URL path of every file under web_root"""
+    paths = []
+    for directory, _, files in os.walk(web_root):
+        for name in sorted(files):
+            rel = os.path.relpath(os.path.join(directory, name), web_root)
+            paths.append('/' + rel.replace(os.sep, '/'))
+    return sorted(paths)
+
+def server_workdir(prefix='provinent-bench-'):
+    """Return a temporary working directory for https_server.py.
+
+    The server keeps sync.db, its audio cache and any certificate it
+    generates in its working directory; this one links ../www and copies
+    an existing localhost certificate, so nothing is left in the repo.
+    """
+    workdir = tempfile.TemporaryDirectory(prefix=prefix)
+    os.symlink(os.path.join(REPO_ROOT, 'www'), os.path.join(workdir.name, 'www'), target_is_directory=True)
+    for name in ('localhost.pem', 'localhost.key'):
+        if os.path.isfile(os.path.join(REPO_ROOT, name)):
+            shutil.copyfile(os.path.join(REPO_ROOT, name), os.path.join(workdir.name, name))
+    return workdir
+
+def wait_for_server(port, timeout=15):
+    """Poll until the server completes a TLS request, or give up"""
+    context = ssl._create_unverified_context()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPSConnection('localhost', port, context=context, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def client(port, paths, offset, deadline, results):
+    """Request paths round-robin until deadline and report what happened"""
+    context = ssl._create_unverified_context()
+    latencies = []
+    received = 0
+    errors = 0
+    index = offset
+
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            # The server speaks HTTP/1.0, so each request is a new TLS connection
+            conn = http.client.HTTPSConnection('localhost', port, context=context, timeout=10)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+            conn.close()
+            if response.status != 200:
+                errors += 1
+                continue
+            received += len(body)
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            errors += 1
+
+    results.put((latencies, received, errors))
+
+def run_round(workers, port, paths, clients, duration):
+    """Benchmark one worker count; returns a result dict or None if the server did not start"""
+    workdir = server_workdir()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(DEV_TOOLS_DIR, 'https_server.py'),
+         '--port', str(port), '--workers', str(workers)],
+        cwd=workdir.name, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        if not wait_for_server(port):
+            return None
+
+        results = multiprocessing.Queue()
+        deadline = time.monotonic() + duration
+        procs = [multiprocessing.Process(target=client, args=(port, paths, i, deadline, results))
+                 for i in range(clients)]
+        started = time.monotonic()
+        for proc in procs:
+            proc.start()
+
+        latencies, received, errors = [], 0, 0
+        for _ in procs:
+            client_latencies, client_received, client_errors = results.get()
+            latencies += client_latencies
+            received += client_received
+            errors += client_errors
+        for proc in procs:
+            proc.join()
+        elapsed = time.monotonic() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        workdir.cleanup()
+
+    latencies.sort()
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'mbps': received / elapsed / (1024 * 1024),
+        'p50': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        'errors': errors
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Dev HTTPS server throughput benchmark')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker counts (default: 1,2,4,8)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per round (default: 10)')
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 4,
+                        help='Client processes (default: CPU count)')
+    parser.add_argument('--port', type=int, default=8543, help='Port for the benchmark server (default: 8543)')
+    args = parser.parse_args()
+
+    web_root = os.path.join(REPO_ROOT, 'www')
+    paths = collect_paths(web_root)
+    if not paths:
+        print(f"\033[31mNo files in {web_root} - run the builders first\033[0m")
+        sys.exit(1)
+
+    worker_counts = [int(count) for count in args.workers.split(',')]
+    print(f"\033[33mBenchmarking {len(paths)} files, {args.clients} clients, {args.duration}s per round\033[0m")
+    print(f"\033[90mCPU cores: {os.cpu_count()}\033[0m")
+
+    rows = []
+    for workers in worker_counts:
+        print(f"  \033[36m{workers} worker(s)...\033[0m")
+        result = run_round(workers, args.port, paths, args.clients, args.duration)
+        if result is None:
+            print("\033[31mServer did not start (are certificates and the cryptography package available?)\033[0m")
+            sys.exit(1)
+        rows.append(result)
+
+    baseline = rows[0]['rps'] or 1
+    print(f"\n\033[33m{'Workers':>7} {'Req/s':>9} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'Errors':>7} {'Speedup':>8}\033[0m")
+    for row in rows:
+        print(f"{row['workers']:>7} {row['rps']:>9.1f} {row['mbps']:>8.2f} {row['p50']:>8.2f} "
+              f"{row['p99']:>8.2f} {row['errors']:>7} {row['rps'] / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,12 @@ Usage: python3 build_css.py [--no-minify]
 import os
 import sys
 import argparse
-import shutil
-from datetime import datetime
 import re
 
+from backup_store import BackupStore, add_backup_arguments, write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+from size_budget import BudgetExceeded, SizeTracker, add_budget_arguments
+
 def remove_css_comments(css_content):
     """Remove CSS comments from content"""
     # Remove block comments /* */
@@ -89,7 +91,13 @@ def get_file_size_stats(original_content, minified_content, file_name):
 def main():
     parser = argparse.ArgumentParser(description='CSS Concatenator and Minifier')
     parser.add_argument('--no-minify', action='store_true', help='Skip minification')
+    add_profile_arguments(parser)
+    add_budget_arguments(parser)
+    add_backup_arguments(parser)
     args = parser.parse_args()
+    profiler = BuildProfiler.from_args('build-css', args)
+    sizes = SizeTracker('build-css')
+    backups = BackupStore.from_args(args)
 
     # Define the proper concatenation order
     file_order = [
@@ -139,16 +147,6 @@ def main():
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # Backup existing file if it exists
-    if os.path.exists(output_path):
-        backup_dir = os.path.join(source_dir, "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-
-        backup_file_name = f"styles.css.backup.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-        backup_path = os.path.join(backup_dir, backup_file_name)
-        shutil.copy2(output_path, backup_path)
-        print(f"\033[33mBacked up existing file to: {backup_path}\033[0m")
-
     # Track statistics
     total_original_size = 0
     total_minified_size = 0
@@ -158,22 +156,27 @@ def main():
 
     # Collect all content
     all_content = []
+    all_original = []
 
     for file in file_order:
         full_path = os.path.join(source_dir, file)
 
         # Read file content with UTF-8 encoding
-        with open(full_path, 'r', encoding='utf-8') as f:
-            original_content = f.read()
+        with profiler.stage('read', file):
+            with open(full_path, 'r', encoding='utf-8') as f:
+                original_content = f.read()
 
+        all_original.append(original_content)
         processed_content = original_content
 
         if not args.no_minify:
             # Full minification
-            processed_content = minify_css(processed_content)
+            with profiler.stage('process', file):
+                processed_content = minify_css(processed_content)
 
         # Get file statistics
-        stats = get_file_size_stats(original_content, processed_content, file)
+        with profiler.stage('stat', file):
+            stats = get_file_size_stats(original_content, processed_content, file)
         total_original_size += stats['original_size']
         total_minified_size += stats['minified_size']
         file_stats.append(stats)
@@ -199,9 +202,27 @@ def main():
     # Join all content with newlines
     final_content = '\n'.join(all_content)
 
+    # Size budgets only apply to minified output; check them before anything is written
+    if not args.no_minify:
+        try:
+            with profiler.stage('budget', output_file):
+                sizes.record(output_file, ''.join(all_original), final_content)
+                sizes.check(enforce=not args.skip_budgets)
+        except BudgetExceeded as e:
+            print(f"\n\033[31m{e}\033[0m")
+            print(f"\033[31mNothing was written to {output_path}\033[0m")
+            profiler.report()
+            sys.exit(1)
+
+    # Back up the existing file unless that content is already stored
+    with profiler.stage('backup', output_file):
+        entry = backups.backup(output_path, output_file)
+        if entry:
+            print(f"\033[33mBacked up existing file to: {backups.root} ({entry['hash'][:12]})\033[0m")
+
     # Write the final content
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_content)
+    with profiler.stage('write', output_file):
+        written = write_text_atomic(output_path, final_content)
 
     # Calculate total savings
     if total_original_size > 0:
@@ -224,12 +245,21 @@ def main():
         saved_kb = round((total_original_size - total_minified_size) / 1024, 1)
         print(f"\033[32m  Space saved:    {total_savings}% ({saved_kb} KB)\033[0m")
 
-    print(f"\033[33mOutput file: {output_path}\033[0m")
+    print(f"\033[33mOutput file: {output_path}{'' if written else ' (unchanged)'}\033[0m")
+
+    with profiler.stage('backup'):
+        removed = backups.prune()
+    print(f"\033[90mBackups: {backups.root} ({len(backups.entries)} kept, {removed} pruned)\033[0m")
+
+    sizes.save()
+    profiler.report()
 
     # Usage examples
     print("\n\033[90mUsage examples:\033[0m")
     print("  python3 build_css.py           # Full minification")
     print("  python3 build_css.py --no-minify # Concatenate only (no minification)")
+    print("  python3 build_css.py --profile   # Print per-stage timings")
+    print("  python3 build_css.py --skip-budgets # Report size budget overruns without failing")
 
 if __name__ == "__main__":
     main()
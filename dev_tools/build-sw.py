@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Service Worker Builder for Provinent Scripture Study
+Generates ../www/sw.js from ../src/sw.js and a route table derived from the
+build outputs: every asset in ../www (plus 404.html, manifest.json and the
+favicons, copied in if missing) is precached under its content hash and
+served cache-first, chapter JSON and prerendered chapters are
+stale-while-revalidate with an entry cap, and pages are network-first with
+navigation preload. Assets changed since a recent build also get delta
+patches (see release_patches.py) so returning clients download less.
+Run after the other builders.
+Usage: python3 build-sw.py [--no-minify]
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+
+from backup_store import BackupStore, add_backup_arguments, hash_file, write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+from release_patches import REVISION_LENGTH, ReleaseStore, add_patch_arguments, build_patches, remove_stale_patches, save_patches
+from size_budget import BudgetExceeded, SizeTracker, add_budget_arguments, read_app_version
+
+SOURCE_FILE = "../src/sw.js"
+OUTPUT_DIR = "../www"
+API_MODULE = "modules/api.js"
+
+# Files the other builders do not produce, copied into OUTPUT_DIR from the
+# first of these roots that has them, so everything precached is served
+STATIC_ASSETS = [
+    "404.html", "manifest.json",
+    "favicons/apple-touch-icon.png", "favicons/favicon.png",
+    "favicons/favicon-16x16.png", "favicons/favicon-32x32.png",
+    "favicons/favicon-192x192.png", "favicons/favicon-512x512.png"
+]
+STATIC_ROOTS = ["../src", ".."]
+
+# Output paths that are never precached
+EXCLUDED_PREFIXES = ("prerendered/", "patches/")
+EXCLUDED_FILES = ("sw.js",)
+EXCLUDED_SUFFIXES = (".gz", ".br", ".map")
+
+CHAPTER_CACHE_ENTRIES = 200   # Chapters kept for offline reading
+PRERENDER_CACHE_ENTRIES = 200
+RUNTIME_CACHE_ENTRIES = 60    # Third-party scripts, styles and fonts
+
+BUILD_PATTERN = re.compile(r'^const BUILD = .*;$', re.MULTILINE)
+
+def load_remove_comments():
+    """Reuse the JavaScript minifier from minify-js.py"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "minify-js.py")
+    spec = importlib.util.spec_from_file_location("minify_js", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.remove_comments
+
+def find_static_assets(output_dir):
+    """Return {relative path: source path} for STATIC_ASSETS missing from output_dir"""
+    missing = {}
+    for rel in STATIC_ASSETS:
+        if os.path.isfile(os.path.join(output_dir, rel)):
+            continue
+        for root in STATIC_ROOTS:
+            path = os.path.join(root, rel)
+            if os.path.isfile(path):
+                missing[rel] = path
+                break
+        else:
+            print(f"  \033[33mNot found, not precached: {rel}\033[0m")
+    return missing
+
+def copy_static_assets(output_dir, missing):
+    """Copy the files found by find_static_assets() into output_dir"""
+    for rel, path in missing.items():
+        dest = os.path.join(output_dir, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+        print(f"  \033[36mCopied into {output_dir}: {rel}\033[0m")
+
+def collect_assets(output_dir, static):
+    """Return {url path: file path} for every file to precache.
+
+    static maps files still to be copied into output_dir to their sources.
+    """
+    assets = {'/' + rel: path for rel, path in static.items()}
+
+    for directory, dirs, files in os.walk(output_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            rel = os.path.relpath(path, output_dir).replace(os.sep, '/')
+            if (name.startswith('.') or rel in EXCLUDED_FILES
+                    or rel.startswith(EXCLUDED_PREFIXES) or rel.endswith(EXCLUDED_SUFFIXES)):
+                continue
+            assets['/' + rel] = path
+
+    return dict(sorted(assets.items()))
+
+def read_js_constant(content, name):
+    match = re.search(rf"const {name} = '([^']+)'", content)
+    return match.group(1) if match else None
+
+def split_url(url):
+    """Split 'https://host/path' into ('https://host', '/path')"""
+    match = re.match(r'^(https?://[^/]+)(/.*)?$', url)
+    if not match:
+        raise ValueError(f"Not an absolute URL: {url}")
+    return match.group(1), (match.group(2) or '/').rstrip('/')
+
+def build_routes(output_dir):
+    """Derive the runtime route table from the built app"""
+    api_path = os.path.join(output_dir, API_MODULE)
+    if not os.path.isfile(api_path):
+        api_path = os.path.join("../src", API_MODULE)
+    with open(api_path, 'r', encoding='utf-8') as f:
+        api_js = f.read()
+
+    routes = []
+
+    api_base = read_js_constant(api_js, 'API_BASE_URL')
+    if api_base:
+        # fetchChapter(): <API_BASE_URL>/<translation>/<BOOK>/<chapter>.json
+        origin, prefix = split_url(api_base)
+        routes.append({
+            'name': 'chapters', 'strategy': 'stale-while-revalidate',
+            'origin': origin, 'pattern': f"^{re.escape(prefix)}/[^/]+/[^/]+/\\d+\\.json$",
+            'cache': 'provinent-chapters', 'maxEntries': CHAPTER_CACHE_ENTRIES
+        })
+    else:
+        print(f"  \033[33mAPI_BASE_URL not found in {api_path}; chapter JSON is not cached\033[0m")
+
+    if os.path.isdir(os.path.join(output_dir, "prerendered")):
+        routes.append({
+            'name': 'prerendered', 'strategy': 'stale-while-revalidate',
+            'origin': 'self', 'pattern': r"^/prerendered/[^/]+/[^/]+/\d+\.html$",
+            'cache': 'provinent-prerendered', 'maxEntries': PRERENDER_CACHE_ENTRIES
+        })
+
+    # Audio is streamed with range requests; leave it to the browser
+    audio_base = read_js_constant(api_js, 'KJV_AUDIO_BASE_URL')
+    if audio_base:
+        origin, prefix = split_url(audio_base)
+        for route_origin in (origin, 'self'):
+            routes.append({
+                'name': 'audio', 'strategy': 'network-only',
+                'origin': route_origin, 'pattern': f"^{re.escape(prefix)}/"
+            })
+
+    routes.append({
+        'name': 'runtime', 'strategy': 'network-first',
+        'origin': '*', 'pattern': '',
+        'cache': 'provinent-runtime', 'maxEntries': RUNTIME_CACHE_ENTRIES
+    })
+    return routes
+
+def main():
+    parser = argparse.ArgumentParser(description='Service Worker Builder')
+    parser.add_argument('--no-minify', action='store_true', help='Skip comment removal')
+    add_profile_arguments(parser)
+    add_budget_arguments(parser)
+    add_backup_arguments(parser)
+    add_patch_arguments(parser)
+    args = parser.parse_args()
+    profiler = BuildProfiler.from_args('build-sw', args)
+    sizes = SizeTracker('build-sw')
+    backups = BackupStore.from_args(args)
+
+    dest_file = os.path.join(OUTPUT_DIR, "sw.js")
+
+    print("\033[33mChecking files...\033[0m")
+
+    if not os.path.isfile(SOURCE_FILE):
+        print(f"\033[31mMissing: {SOURCE_FILE}\033[0m")
+        sys.exit(1)
+    if not os.path.isdir(OUTPUT_DIR):
+        print(f"\033[31mNo build output in {OUTPUT_DIR} - run the other builders first\033[0m")
+        sys.exit(1)
+
+    with profiler.stage('read', 'sw.js'):
+        with open(SOURCE_FILE, 'r', encoding='utf-8') as f:
+            template = f.read()
+
+    if not BUILD_PATTERN.search(template):
+        print(f"\033[31m{SOURCE_FILE} has no 'const BUILD = ...;' line to replace\033[0m")
+        sys.exit(1)
+
+    print("\033[32mAll files found\033[0m")
+
+    print("\n\033[33mCollecting build outputs...\033[0m")
+
+    with profiler.stage('hash'):
+        static = find_static_assets(OUTPUT_DIR)
+        assets = collect_assets(OUTPUT_DIR, static)
+        digests = {url: hash_file(path) for url, path in assets.items()}
+
+    releases = None
+    patches = {}
+    if not args.no_patches:
+        with profiler.stage('patch'):
+            releases = ReleaseStore(history=args.patch_history)
+            patches, patch_report, patch_files = build_patches(
+                releases, digests, assets, os.path.join(OUTPUT_DIR, "patches"), args.patch_threshold)
+
+    precache = []
+    for url, digest in digests.items():
+        entry = [url, digest[:REVISION_LENGTH]]
+        if url in patches:
+            entry.append(patches[url])
+        precache.append(entry)
+
+    with profiler.stage('routes'):
+        routes = build_routes(OUTPUT_DIR)
+
+    # The worker's bytes change whenever any asset does, which is what
+    # makes the browser install the new worker and fetch the changed assets
+    build_hash = hashlib.sha256(json.dumps([precache, routes]).encode('utf-8')).hexdigest()[:10]
+    build = {
+        'version': f"{read_app_version() or 'dev'}+{build_hash}",
+        'precache': precache,
+        'routes': routes
+    }
+
+    with profiler.stage('process', 'sw.js'):
+        content = template if args.no_minify else load_remove_comments()(template)
+        if not content.endswith('\n'):
+            content += '\n'
+        build_json = json.dumps(build, separators=(',', ':'))
+        content = BUILD_PATTERN.sub(lambda _: f"const BUILD = {build_json};", content, count=1)
+
+    with profiler.stage('stat', 'sw.js'):
+        sizes.record('sw.js', template, content)
+
+    precache_size = sum(os.path.getsize(path) for path in assets.values())
+    print(f"  \033[36mPrecache: {len(precache)} assets, {round(precache_size / 1024, 1)} KB\033[0m")
+    for url, rev, *patch_from in precache:
+        note = f"  (patches from {', '.join(patch_from[0])})" if patch_from else ''
+        print(f"    \033[90m{rev}  {url}{note}\033[0m")
+
+    print(f"  \033[36mRoutes:\033[0m")
+    print(f"    \033[90m{'navigate':<12} network-first (navigation preload)\033[0m")
+    for route in routes:
+        origin = route['origin'] if route['origin'] != 'self' else '(same origin)'
+        cap = f", max {route['maxEntries']}" if route.get('maxEntries') else ''
+        print(f"    \033[90m{route['name']:<12} {route['strategy']}{cap}  {origin} {route['pattern']}\033[0m")
+
+    if releases is not None:
+        print(f"  \033[36mUpdate cost for returning clients (gzip, vs. full downloads):\033[0m")
+        if not patch_report:
+            print(f"    \033[90mNo earlier release in {releases.root}\033[0m")
+        for row in patch_report:
+            saved = row['full'] - row['patched']
+            percent = round(saved / row['full'] * 100, 1) if row['full'] else 0
+            print(f"    \033[90mfrom {row['version']}: {row['changed']} changed, "
+                  f"{row['patches']} patched, {round(row['full'] / 1024, 1)} KB -> "
+                  f"{round(row['patched'] / 1024, 1)} KB\033[0m \033[32msaved {percent}%\033[0m")
+
+    # Check the budget before anything is written
+    if not args.no_minify:
+        try:
+            with profiler.stage('budget'):
+                sizes.check(enforce=not args.skip_budgets)
+        except BudgetExceeded as e:
+            print(f"\n\033[31m{e}\033[0m")
+            print(f"\033[31mNothing was written to {dest_file}\033[0m")
+            profiler.report()
+            sys.exit(1)
+
+    with profiler.stage('backup', 'sw.js'):
+        entry = backups.backup(dest_file, 'sw.js')
+        if entry:
+            print(f"\n  \033[33mBackup: {entry['hash'][:12]}\033[0m")
+
+    with profiler.stage('write'):
+        copy_static_assets(OUTPUT_DIR, static)
+        if releases is not None:
+            save_patches(os.path.join(OUTPUT_DIR, "patches"), patch_files)
+
+    with profiler.stage('write', 'sw.js'):
+        if write_text_atomic(dest_file, content):
+            print(f"\n\033[32mWritten to: {dest_file} (build {build['version']})\033[0m")
+        else:
+            print(f"\n\033[90mUnchanged: {dest_file} (build {build['version']})\033[0m")
+
+    if releases is not None:
+        with profiler.stage('patch'):
+            remove_stale_patches(os.path.join(OUTPUT_DIR, "patches"), patch_files)
+            if releases.record(build['version'], digests, assets):
+                print(f"\033[90mRecorded release {build['version']} in {releases.root}\033[0m")
+
+    with profiler.stage('backup'):
+        removed = backups.prune()
+    print(f"\033[90mBackups: {backups.root} ({len(backups.entries)} kept, {removed} pruned)\033[0m")
+
+    sizes.save()
+    profiler.report()
+
+    print("\n\033[90mUse: python3 build-sw.py [--no-minify] [--profile] [--skip-budgets]\033[0m")
+
+if __name__ == "__main__":
+    main()
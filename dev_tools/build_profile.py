@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Build stage profiler for the Provinent Scripture Study dev_tools builders
+Adds --profile, --profile-cprofile, --profile-memory and --profile-dir
+"""
+
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+def add_profile_arguments(parser):
+    """Add the profiling options shared by every builder"""
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each build stage and print a summary table')
+    parser.add_argument('--profile-cprofile', action='store_true',
+                        help='Also capture cProfile data and dump a .pstats file (implies --profile)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record tracemalloc peak allocations per file (implies --profile)')
+    parser.add_argument('--profile-dir', default='../profiles',
+                        help='Directory for .pstats dumps (default: ../profiles)')
+
+class BuildProfiler:
+    """Times named build stages per file, optionally under cProfile and tracemalloc"""
+
+    def __init__(self, name, enabled=False, cprofile=False, memory=False, output_dir='../profiles'):
+        self.name = name
+        self.enabled = enabled or cprofile or memory
+        self.memory = memory
+        self.output_dir = output_dir
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.timings = {}     # (stage, file) -> [calls, seconds]
+        self.peaks = {}       # file -> most bytes any one stage allocated on top of its start
+
+        if self.memory:
+            tracemalloc.start()
+
+    @classmethod
+    def from_args(cls, name, args):
+        return cls(name, enabled=args.profile, cprofile=args.profile_cprofile,
+                   memory=args.profile_memory, output_dir=args.profile_dir)
+
+    @contextmanager
+    def stage(self, stage, file_name='-'):
+        """Time the enclosed block as one run of stage for file_name"""
+        if not self.enabled:
+            yield
+            return
+
+        if self.memory:
+            tracemalloc.reset_peak()
+            # Count only what the stage allocates, not memory already held
+            baseline = tracemalloc.get_traced_memory()[0]
+        if self.profiler:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.profiler:
+                self.profiler.disable()
+
+            entry = self.timings.setdefault((stage, file_name), [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                self.peaks[file_name] = max(self.peaks.get(file_name, 0), peak - baseline)
+
+    def report(self):
+        """Print the stage summary and write the cProfile dump, if any"""
+        if not self.enabled:
+            return
+
+        print("\n\033[33mBuild profile:\033[0m")
+        print(f"  \033[90m{'Stage':<10} {'File':<24} {'Calls':>5} {'Time (ms)':>10}\033[0m")
+        rows = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+        for (stage, file_name), (calls, seconds) in rows:
+            print(f"  {stage:<10} {file_name:<24} {calls:>5} {seconds * 1000:>10.2f}")
+
+        # Totals per stage show where the build spends its time overall
+        stage_totals = {}
+        for (stage, _), (_, seconds) in self.timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+        total = sum(stage_totals.values())
+
+        print(f"\n  \033[90m{'Stage':<10} {'Time (ms)':>10} {'Share':>7}\033[0m")
+        for stage, seconds in sorted(stage_totals.items(), key=lambda item: item[1], reverse=True):
+            share = round(seconds / total * 100, 1) if total > 0 else 0
+            print(f"  {stage:<10} {seconds * 1000:>10.2f} {share:>6}%")
+        print(f"  \033[32m{'Total':<10} {total * 1000:>10.2f}\033[0m")
+
+        if self.memory:
+            tracemalloc.stop()
+            print(f"\n  \033[90m{'File':<24} {'Peak alloc (KB)':>16}\033[0m")
+            for file_name, peak in sorted(self.peaks.items(), key=lambda item: item[1], reverse=True):
+                print(f"  {file_name:<24} {round(peak / 1024, 1):>16}")
+
+        if self.profiler:
+            os.makedirs(self.output_dir, exist_ok=True)
+            dump_path = os.path.join(
+                self.output_dir, f"{self.name}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.pstats")
+            self.profiler.dump_stats(dump_path)
+
+            print("\n\033[33mTop functions by cumulative time:\033[0m")
+            pstats.Stats(self.profiler).strip_dirs().sort_stats('cumulative').print_stats(15)
+            print(f"\033[90mcProfile data: {dump_path}\033[0m")
@@ -2,20 +2,45 @@
 # Requires: pip install pyopenssl
 # Run with: python https_server.py
 
+import argparse
 import http.server
+import json
+import sqlite3
 import ssl
 import os
 import sys
+import time
 from pathlib import Path
 
+from audio_cache import AUDIO_FILE_PATTERN, AUDIO_ROUTE, AudioCache, OriginDownload, parse_range
+from prefork import DevHTTPServer, prefork_supported, run_supervisor, serve_until_signalled
+from server_metrics import METRICS_ROUTE, AccessLog, CountingWriter, ServerMetrics
+from sync_store import MAX_BODY_BYTES, SYNC_ROUTE, SyncError, SyncStore, decode_request
+
 # Configuration
 PORT = 443
 WEB_ROOT = Path("./www")
 CERT_FILE = "localhost.pem"
 KEY_FILE = "localhost.key"
 
+# Chapter audio cache - AUDIO_ORIGIN may also be a local directory of MP3s
+AUDIO_ORIGIN = "https://openbible.com/audio/kjv"
+AUDIO_CACHE_DIR = Path("./audio-cache")
+AUDIO_PREFETCH = True  # Fetch the next chapter while the current one plays
+
+# Study-data sync endpoint storage (SQLite, WAL mode)
+SYNC_DB = Path("./sync.db")
+
+audio_cache = None
+sync_store = None
+metrics = ServerMetrics()
+access_log = AccessLog()
+
 def generate_self_signed_cert():
     """Generate self-signed certificate if it doesn't exist"""
+    if os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE):
+        return
+    
     from cryptography import x509
     from cryptography.x509.name import Name
     from cryptography.x509.oid import NameOID
@@ -24,9 +49,6 @@ def generate_self_signed_cert():
     from cryptography.hazmat.backends import default_backend
     import datetime
     
-    if os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE):
-        return
-    
     print("Generating self-signed certificate...")
     
     # Generate private key
@@ -84,7 +106,35 @@ class HTTPSRequestHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(WEB_ROOT), **kwargs)
     
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+    
+    def handle_one_request(self):
+        # Time every request and record it against the route that served it
+        self.route = "static"
+        self.status = None
+        started = time.perf_counter()
+        written = self.wfile.written
+
+        super().handle_one_request()
+
+        if self.status is not None:
+            metrics.observe(self.route, self.command or "-", self.status,
+                            time.perf_counter() - started, self.wfile.written - written)
+    
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+    
     def do_GET(self):
+        # Chapter audio is served from the local cache, not the web root
+        if self.path.startswith(AUDIO_ROUTE):
+            return self.serve_audio()
+
+        if self.path.split('?', 1)[0] == METRICS_ROUTE:
+            return self.serve_metrics()
+        
         # Security check - prevent path traversal first
         requested_path = Path(self.translate_path(self.path))
         web_root = Path(WEB_ROOT).resolve()
@@ -99,7 +149,11 @@ class HTTPSRequestHandler(http.server.SimpleHTTPRequestHandler):
         
         # Check if the requested file exists
         original_path = self.path
-        file_path = WEB_ROOT / original_path[1:]  # Remove leading slash
+        file_path = WEB_ROOT / original_path.split('?', 1)[0][1:]  # Remove leading slash
+        
+        # A directory with an index.html (such as /) is a real page, not a SPA route
+        if file_path.is_dir() and (file_path / 'index.html').is_file():
+            return super().do_GET()
         
         # If the file doesn't exist, serve index.html for SPA routing
         if not file_path.exists() or file_path.is_dir():
@@ -118,20 +172,230 @@ class HTTPSRequestHandler(http.server.SimpleHTTPRequestHandler):
             
             # Serve index.html for SPA routes
             self.path = '/index.html'
+            self.route = "spa_fallback"
+            metrics.count_spa_fallback()
         
         return super().do_GET()
     
+    def do_HEAD(self):
+        if self.path.startswith(AUDIO_ROUTE):
+            return self.serve_audio(head_only=True)
+        return super().do_HEAD()
+    
+    def serve_audio(self, head_only=False):
+        """Serve a chapter MP3 from the audio cache, honouring Range requests"""
+        self.route = "audio"
+        file_name = self.path[len(AUDIO_ROUTE):].split('?', 1)[0]
+        if not AUDIO_FILE_PATTERN.match(file_name):
+            self.send_error(404, "File not found")
+            return
+
+        file_path = audio_cache.cached_path(file_name)
+        metrics.count_audio_cache(file_path is not None)
+
+        try:
+            if file_path is None and audio_cache.is_remote:
+                file_path = audio_cache.download(file_name)
+            elif file_path is None:
+                file_path = audio_cache.get(file_name)
+        except Exception as e:
+            self.send_error(502, f"Audio origin error: {e}")
+            return
+
+        if isinstance(file_path, OriginDownload):
+            # Stream the miss while it fills the cache instead of waiting for the whole file
+            with file_path as download:
+                try:
+                    self.stream_audio(download, head_only)
+                except Exception as e:
+                    # Headers are already sent; all we can do is cut the response short
+                    self.log_error("Audio origin error during %s: %s", file_name, e)
+                    self.close_connection = True
+                    return
+            audio_cache.prefetch_next(file_name)
+            return
+
+        if file_path is None:
+            self.send_error(404, "File not found")
+            return
+
+        size = file_path.stat().st_size
+        byte_range = self.send_audio_headers(size)
+        if byte_range is None:
+            return
+
+        start, length = byte_range
+        if not head_only and length:
+            try:
+                # socket.sendfile() uses os.sendfile() where the socket allows it
+                with open(file_path, 'rb') as f:
+                    self.wfile.add(self.connection.sendfile(f, start, length))
+            except (BrokenPipeError, ConnectionResetError):
+                # The player aborted this range to seek elsewhere
+                pass
+
+        audio_cache.prefetch_next(file_name)
+    
+    def send_audio_headers(self, size):
+        """Send the status and headers for an MP3 of size bytes (None if unknown).
+
+        Returns (start, length) of the bytes to send, or None after a 416.
+        """
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size) if size is not None else None
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            start, end = 0, (size - 1 if size is not None else None)
+            self.send_response(200)
+
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Accept-Ranges", "bytes")
+        length = None
+        if size is not None:
+            length = end - start + 1 if size else 0
+            # Without a size the body ends when the connection closes (HTTP/1.0)
+            self.send_header("Content-Length", str(length))
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.end_headers()
+        return start, length
+    
+    def stream_audio(self, download, head_only):
+        """Send the requested range of a download as it arrives, then finish filling the cache"""
+        byte_range = self.send_audio_headers(download.size)
+        sending = byte_range is not None and not head_only
+        start, length = byte_range or (0, 0)
+        end = start + length if length is not None else None
+        offset = 0
+
+        for chunk in download:
+            chunk_start, offset = offset, offset + len(chunk)
+            if not sending or offset <= start:
+                continue
+            piece = chunk[max(start - chunk_start, 0):(end - chunk_start) if end is not None else None]
+            try:
+                self.wfile.write(piece)
+            except (BrokenPipeError, ConnectionResetError):
+                # The player went away; keep downloading so the cache still gets the file
+                sending = False
+            if end is not None and offset >= end:
+                sending = False
+    
+    def do_POST(self):
+        if self.path.split('?', 1)[0] == SYNC_ROUTE:
+            return self.serve_sync()
+        self.send_error(404, "File not found")
+    
+    def serve_sync(self):
+        """Apply a batch of highlight/note changes and return the deltas since the client's cursor"""
+        self.route = "sync"
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, "Invalid Content-Length")
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_error(413, "Sync batch too large")
+            return
+
+        try:
+            request = decode_request(self.rfile.read(length))
+            response = sync_store.sync(request)
+        except SyncError as e:
+            self.send_error(400, str(e))
+            return
+        except sqlite3.Error as e:
+            # Locked or unwritable database: the client keeps its batch and retries
+            self.log_error("Sync store error: %s", e)
+            self.send_error(503, "Sync store unavailable")
+            return
+
+        body = json.dumps(response, separators=(',', ':')).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_metrics(self):
+        """Export request metrics in the Prometheus text format"""
+        self.route = "metrics"
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+    
     def log_message(self, format, *args):
-        # Custom logging format to show SPA routing
-        print(f"{self.address_string()} - {self.log_date_time_string()} - {format % args}")
+        # Custom logging format to show SPA routing; written off the request path
+        access_log.write(f"{self.address_string()} - {self.log_date_time_string()} - {format % args}")
+
 
+def open_stores():
+    """Open the audio cache and sync database for this process"""
+    global audio_cache, sync_store
+    audio_cache = AudioCache(AUDIO_ORIGIN, AUDIO_CACHE_DIR, prefetch=AUDIO_PREFETCH)
+    sync_store = SyncStore(SYNC_DB)
+
+def create_server(host, port, reuse_port=False):
+    """Create the HTTPS server with its own TLS context"""
+    httpd = DevHTTPServer((host, port), HTTPSRequestHandler, reuse_port=reuse_port)
+    
+    # Wrap socket with SSL
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERT_FILE, KEY_FILE)
+    httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+    return httpd
+
+def run_worker(worker_id, host, port):
+    """Body of one pre-forked worker: own caches, metrics, TLS context and socket"""
+    global access_log, metrics
+    metrics = ServerMetrics(worker=worker_id)
+    # Threads do not survive fork, so each worker starts its own log writer
+    access_log = AccessLog()
+    open_stores()
+    httpd = create_server(host, port, reuse_port=True)
+    try:
+        serve_until_signalled(httpd)
+    finally:
+        access_log.close()
 
 def main():
+    global AUDIO_ORIGIN, AUDIO_CACHE_DIR
+    parser = argparse.ArgumentParser(description='Provinent Scripture Study HTTPS dev server')
+    parser.add_argument('--host', default='localhost', help='Interface to listen on (default: localhost)')
+    parser.add_argument('--port', type=int, default=PORT, help=f'Port to listen on (default: {PORT})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Pre-fork N worker processes sharing the port via SO_REUSEPORT (POSIX only)')
+    parser.add_argument('--audio-origin', default=AUDIO_ORIGIN,
+                        help=f'Chapter MP3 origin, a URL or a local directory (default: {AUDIO_ORIGIN})')
+    parser.add_argument('--audio-cache', type=Path, default=AUDIO_CACHE_DIR,
+                        help=f'Directory for cached chapter MP3s (default: {AUDIO_CACHE_DIR})')
+    args = parser.parse_args()
+    AUDIO_ORIGIN, AUDIO_CACHE_DIR = args.audio_origin, args.audio_cache
+    
     # Create web root directory if it doesn't exist
     WEB_ROOT.mkdir(exist_ok=True)
     print(f"Web root directory: {WEB_ROOT.resolve()}")
+    print(f"Audio cache: {AUDIO_CACHE_DIR.resolve()} (origin: {AUDIO_ORIGIN})")
+    print(f"Sync database: {SYNC_DB.resolve()}")
     
-    # Generate SSL certificate if needed
+    # Generate SSL certificate if needed - once, before any worker starts
     try:
         generate_self_signed_cert()
     except ImportError:
@@ -139,15 +403,24 @@ def main():
         print("Install with: pip install pyopenssl cryptography")
         sys.exit(1)
     
-    # Create HTTP server with SSL
-    httpd = http.server.HTTPServer(('localhost', PORT), HTTPSRequestHandler)
+    if args.workers > 1:
+        if not prefork_supported():
+            print("Error: --workers needs os.fork() and SO_REUSEPORT (Linux, macOS or BSD)")
+            sys.exit(1)
     
-    # Wrap socket with SSL
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain(CERT_FILE, KEY_FILE)
-    httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+        print(f"HTTPS Server starting {args.workers} workers on https://{args.host}:{args.port}")
+        print("Press Ctrl+C to stop the server")
+        run_supervisor(args.workers, lambda worker_id: run_worker(worker_id, args.host, args.port))
+        access_log.close()
+        print("Server stopped")
+        return
+    
+    open_stores()
+    
+    # Create HTTP server with SSL
+    httpd = create_server(args.host, args.port)
     
-    print(f"HTTPS Server started on https://localhost:{PORT}")
+    print(f"HTTPS Server started on https://{args.host}:{args.port}")
     print("Press Ctrl+C to stop the server")
     print("Note: Browser will warn about self-signed certificate - this is expected")
     
@@ -157,6 +430,8 @@ def main():
         print("\nServer stopped")
     except Exception as e:
         print(f"Server error: {e}")
+    finally:
+        access_log.close()
 
 if __name__ == '__main__':
     # Check if running as administrator (required for port 443 on most systems)
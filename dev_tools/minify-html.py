@@ -8,9 +8,11 @@ Usage: python3 minify_html.py [--no-minify]
 import os
 import sys
 import argparse
-import shutil
 import re
-from datetime import datetime
+
+from backup_store import BackupStore, add_backup_arguments, write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+from size_budget import BudgetExceeded, SizeTracker, add_budget_arguments
 
 def remove_html_comments(html_content):
     """Remove HTML comments but preserve the specific GPL license comment format"""
@@ -85,7 +87,13 @@ def get_file_size_stats(original_content, minified_content, file_name):
 def main():
     parser = argparse.ArgumentParser(description='HTML Minifier - Comments and Newlines Only (Preserves GPL License)')
     parser.add_argument('--no-minify', action='store_true', help='Skip minification')
+    add_profile_arguments(parser)
+    add_budget_arguments(parser)
+    add_backup_arguments(parser)
     args = parser.parse_args()
+    profiler = BuildProfiler.from_args('minify-html', args)
+    sizes = SizeTracker('minify-html')
+    backups = BackupStore.from_args(args)
 
     # Simplified file processing - single source file
     source_file = "../src/index.html"
@@ -119,6 +127,7 @@ def main():
     total_original_size = 0
     total_minified_size = 0
     file_stats = []
+    outputs = []
 
     print("\n\033[33mProcessing HTML files...\033[0m")
 
@@ -128,28 +137,23 @@ def main():
 
         print(f"\n  \033[36mProcessing: {file}\033[0m")
 
-        # Backup existing file if it exists
-        if os.path.exists(dest_path):
-            backup_dir = os.path.join(source_dir, "backups")
-            os.makedirs(backup_dir, exist_ok=True)
-
-            backup_file_name = f"{file.replace('/', '_').replace('\\', '_')}.backup.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            backup_path = os.path.join(backup_dir, backup_file_name)
-            shutil.copy2(dest_path, backup_path)
-            print(f"    \033[33mBacked up to: {backup_path}\033[0m")
-
         # Read source file with proper encoding
-        with open(source_path, 'r', encoding='utf-8') as f:
-            original_content = f.read()
+        with profiler.stage('read', file):
+            with open(source_path, 'r', encoding='utf-8') as f:
+                original_content = f.read()
 
         processed_content = original_content
 
         if not args.no_minify:
             # Light minification: only remove comments and newlines
-            processed_content = lightly_minify_html(processed_content)
+            with profiler.stage('process', file):
+                processed_content = lightly_minify_html(processed_content)
 
         # Get statistics
-        stats = get_file_size_stats(original_content, processed_content, file)
+        with profiler.stage('stat', file):
+            stats = get_file_size_stats(original_content, processed_content, file)
+            if not args.no_minify:
+                sizes.record(file, original_content, processed_content)
         total_original_size += stats['original_size']
         total_minified_size += stats['minified_size']
         file_stats.append(stats)
@@ -165,10 +169,32 @@ def main():
             original_kb = round(stats['original_size'] / 1024, 1)
             print(f"    \033[90mSize: {original_kb} KB (no minification)\033[0m")
 
+        outputs.append((file, dest_path, processed_content))
+
+    # Size budgets only apply to minified output; check them before anything is written
+    if not args.no_minify:
+        try:
+            with profiler.stage('budget'):
+                sizes.check(enforce=not args.skip_budgets)
+        except BudgetExceeded as e:
+            print(f"\n\033[31m{e}\033[0m")
+            print(f"\033[31mNothing was written to {output_base}\033[0m")
+            profiler.report()
+            sys.exit(1)
+
+    for file, dest_path, processed_content in outputs:
+        # Back up the existing file unless that content is already stored
+        with profiler.stage('backup', file):
+            entry = backups.backup(dest_path, file)
+            if entry:
+                print(f"\n  \033[33mBacked up {file} to: {backups.root} ({entry['hash'][:12]})\033[0m")
+
         # Write the processed content
-        with open(dest_path, 'w', encoding='utf-8') as f:
-            f.write(processed_content)
-        print(f"    \033[36mWritten to: {dest_path}\033[0m")
+        with profiler.stage('write', file):
+            if write_text_atomic(dest_path, processed_content):
+                print(f"  \033[36mWritten to: {dest_path}\033[0m")
+            else:
+                print(f"  \033[90mUnchanged: {dest_path}\033[0m")
 
     # Calculate total savings
     if total_original_size > 0:
@@ -198,10 +224,19 @@ def main():
         method = "Copy without minification"
     print(f"  \033[90mMethod:          {method}\033[0m")
 
+    with profiler.stage('backup'):
+        removed = backups.prune()
+    print(f"  \033[90mBackups:         {backups.root} ({len(backups.entries)} kept, {removed} pruned)\033[0m")
+
+    sizes.save()
+    profiler.report()
+
     # Usage examples
     print("\n\033[90mUsage examples:\033[0m")
     print("  python3 minify_html.py           # Light minification (comments/newlines only)")
     print("  python3 minify_html.py --no-minify # Copy without minification")
+    print("  python3 minify_html.py --profile   # Print per-stage timings")
+    print("  python3 minify_html.py --skip-budgets # Report size budget overruns without failing")
 
 if __name__ == "__main__":
     main()
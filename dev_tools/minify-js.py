@@ -7,9 +7,11 @@ Usage: python3 build_js.py [--no-minify]
 import os
 import sys
 import argparse
-import shutil
 import re
-from datetime import datetime
+
+from backup_store import BackupStore, add_backup_arguments, write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+from size_budget import BudgetExceeded, SizeTracker, add_budget_arguments
 
 def remove_comments(content):
     """Remove comments from JavaScript code while preserving special cases"""
@@ -67,11 +69,16 @@ def remove_comments(content):
 def main():
     parser = argparse.ArgumentParser(description='JavaScript Builder')
     parser.add_argument('--no-minify', action='store_true', help='Skip comment removal')
+    add_profile_arguments(parser)
+    add_budget_arguments(parser)
+    add_backup_arguments(parser)
     args = parser.parse_args()
+    profiler = BuildProfiler.from_args('minify-js', args)
+    sizes = SizeTracker('minify-js')
+    backups = BackupStore.from_args(args)
 
     files = [
         "../src/main.js",
-        "../src/sw.js",
         "../src/modules/api.js",
         "../src/modules/highlights.js",
         "../src/modules/hotkeys.js",
@@ -99,13 +106,11 @@ def main():
 
     print("\033[32mAll files found\033[0m")
 
-    # Ensure modules directory exists for backups
-    os.makedirs("../src/modules", exist_ok=True)
-
     total_orig_size = 0
     total_proc_size = 0
     total_orig_lines = 0
     total_proc_lines = 0
+    outputs = []
 
     print("\033[33mProcessing files...\033[0m")
 
@@ -115,28 +120,26 @@ def main():
 
         print(f"  \033[36m{file_name}\033[0m")
 
-        # Create backup if destination exists
-        if os.path.exists(dst_file):
-            backup_name = f"{file_name}.backup_{datetime.now().strftime('%Y%m%d_%H%m%S')}"
-            backup_path = os.path.join("../src/modules", backup_name)
-            shutil.copy2(dst_file, backup_path)
-            print(f"    \033[33mBackup: {backup_path}\033[0m")
-
         # Read source file
-        with open(src_file, 'r', encoding='utf-8') as f:
-            orig_content = f.read()
+        with profiler.stage('read', file_name):
+            with open(src_file, 'r', encoding='utf-8') as f:
+                orig_content = f.read()
 
         # Process content
-        if args.no_minify:
-            proc_content = orig_content
-        else:
-            proc_content = remove_comments(orig_content)
+        with profiler.stage('process', file_name):
+            if args.no_minify:
+                proc_content = orig_content
+            else:
+                proc_content = remove_comments(orig_content)
 
         # Calculate statistics
-        orig_size = len(orig_content.encode('utf-8'))
-        proc_size = len(proc_content.encode('utf-8'))
-        orig_lines = len(orig_content.splitlines())
-        proc_lines = len(proc_content.splitlines())
+        with profiler.stage('stat', file_name):
+            orig_size = len(orig_content.encode('utf-8'))
+            proc_size = len(proc_content.encode('utf-8'))
+            orig_lines = len(orig_content.splitlines())
+            proc_lines = len(proc_content.splitlines())
+            if not args.no_minify:
+                sizes.record(os.path.relpath(dst_file, "../www"), orig_content, proc_content)
 
         total_orig_size += orig_size
         total_proc_size += proc_size
@@ -160,12 +163,35 @@ def main():
             orig_kb = round(orig_size / 1024, 1)
             print(f"    \033[37mCopied: {orig_kb}KB, {orig_lines} lines\033[0m")
 
+        outputs.append((file_name, dst_file, proc_content))
+
+    # Size budgets only apply to minified output; check them before anything is written
+    if not args.no_minify:
+        try:
+            with profiler.stage('budget'):
+                sizes.check(enforce=not args.skip_budgets)
+        except BudgetExceeded as e:
+            print(f"\n\033[31m{e}\033[0m")
+            print("\033[31mNothing was written to ../www\033[0m")
+            profiler.report()
+            sys.exit(1)
+
+    print("\n\033[33mWriting files...\033[0m")
+
+    for file_name, dst_file, proc_content in outputs:
+        # Back up the current output unless that content is already stored
+        with profiler.stage('backup', file_name):
+            entry = backups.backup(dst_file, os.path.relpath(dst_file, "../www").replace('\\', '/'))
+            if entry:
+                print(f"  \033[33m{file_name}: backup {entry['hash'][:12]}\033[0m")
+
         # Ensure destination directory exists
         os.makedirs(os.path.dirname(dst_file), exist_ok=True)
 
         # Write processed content
-        with open(dst_file, 'w', encoding='utf-8') as f:
-            f.write(proc_content)
+        with profiler.stage('write', file_name):
+            if not write_text_atomic(dst_file, proc_content):
+                print(f"  \033[90m{file_name}: unchanged\033[0m")
 
     print("\n\033[32mComplete!\033[0m")
 
@@ -190,10 +216,15 @@ def main():
         print(f"  \033[32mSaved: {saved_pct}% ({saved_kb} KB)\033[0m")
         print(f"  \033[36mLines: {total_orig_lines} -> {total_proc_lines} ({lines_pct}%)\033[0m")
 
-    print(f"\n\033[90mBackups: ../src/modules/\033[0m")
+    with profiler.stage('backup'):
+        removed = backups.prune()
+    print(f"\n\033[90mBackups: {backups.root} ({len(backups.entries)} kept, {removed} pruned)\033[0m")
     print("\033[32mUTF-8 preserved\033[0m")
 
-    print("\n\033[90mUse: python3 build_js.py [--no-minify]\033[0m")
+    sizes.save()
+    profiler.report()
+
+    print("\n\033[90mUse: python3 build_js.py [--no-minify] [--profile] [--skip-budgets]\033[0m")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Image Optimizer for Provinent Scripture Study
+Losslessly recompresses the PNGs in ../favicons into ../www/favicons:
+drops ancillary chunks, converts to grayscale or palette form where no
+pixel changes, tries every PNG filter strategy and zlib at level 9, and
+keeps the smallest result. Icons small enough are also inlined as data URIs
+in ../www/index.html, saving a request each.
+Run after minify-html.py and before build-sw.py.
+Usage: python3 optimize-images.py [--jobs N] [--no-inline]
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import re
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from backup_store import write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+
+SOURCE_DIR = "../favicons"
+OUTPUT_DIR = "../www/favicons"
+CACHE_DIR = "../build-cache/images"
+INDEX_HTML = "../www/index.html"
+
+# Kept in ../favicons but never served
+EXCLUDED_FILES = ("favicon-source.png",)
+
+# Icons at or below this size (optimized) are inlined in index.html
+INLINE_LIMIT = 1024
+
+# Bump when the optimizer changes so cached results are rebuilt
+OPTIMIZER_VERSION = 1
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COLOR_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+KEPT_CHUNKS = {b'tRNS'}                        # Ancillary, but part of the pixels
+COLOR_CHUNKS = {b'iCCP', b'sRGB', b'gAMA', b'cHRM'}
+
+def read_chunks(data):
+    """Return [(type, body)] for a PNG file"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG file")
+    chunks = []
+    pos = len(PNG_SIGNATURE)
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunks.append((kind, data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+        if kind == b'IEND':
+            break
+    return chunks
+
+def write_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+def unfilter(data, width, height, bpp):
+    """Undo PNG filtering; returns the raw rows"""
+    stride = width * bpp
+    rows = []
+    prev = bytearray(stride)
+    pos = 0
+    for _ in range(height):
+        kind = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if kind == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+        elif kind == 2:
+            for i in range(stride):
+                row[i] = (row[i] + prev[i]) & 0xff
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                upper_left = prev[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + paeth(left, prev[i], upper_left)) & 0xff
+        elif kind != 0:
+            raise ValueError(f"Unknown filter type {kind}")
+        rows.append(bytes(row))
+        prev = row
+    return rows
+
+def filter_row(kind, row, prev, bpp):
+    """Apply one PNG filter to a row"""
+    if kind == 0:
+        return row
+    left = bytes(bpp) + row[:-bpp]
+    if kind == 1:
+        return bytes((x - a) & 0xff for x, a in zip(row, left))
+    if kind == 2:
+        return bytes((x - b) & 0xff for x, b in zip(row, prev))
+    if kind == 3:
+        return bytes((x - ((a + b) >> 1)) & 0xff for x, a, b in zip(row, left, prev))
+    upper_left = bytes(bpp) + prev[:-bpp]
+    return bytes((x - paeth(a, b, c)) & 0xff for x, a, b, c in zip(row, left, prev, upper_left))
+
+def filter_image(rows, bpp, strategy):
+    """Filter every row with one filter type, or per row by the minimum sum of absolute differences"""
+    out = bytearray()
+    prev = bytes(len(rows[0])) if rows else b''
+    for row in rows:
+        if strategy == 'adaptive':
+            best = None
+            for kind in range(5):
+                filtered = filter_row(kind, row, prev, bpp)
+                score = sum(v if v < 128 else 256 - v for v in filtered)
+                if best is None or score < best[0]:
+                    best = (score, kind, filtered)
+            kind, filtered = best[1], best[2]
+        else:
+            kind = strategy
+            filtered = filter_row(kind, row, prev, bpp)
+        out.append(kind)
+        out += filtered
+        prev = row
+    return bytes(out)
+
+def pack_rows(rows, depth):
+    """Pack 8-bit palette indices into rows of 1, 2 or 4 bits per pixel"""
+    if depth == 8:
+        return rows
+    per_byte = 8 // depth
+    packed = []
+    for row in rows:
+        out = bytearray()
+        for i in range(0, len(row), per_byte):
+            byte = 0
+            group = row[i:i + per_byte]
+            for j, value in enumerate(group):
+                byte |= value << (8 - depth * (j + 1))
+            out.append(byte)
+        packed.append(bytes(out))
+    return packed
+
+def reductions(rows, width, color_type):
+    """Yield lossless (color type, bit depth, rows, extra chunks) forms of 8-bit RGB(A)/gray(A) pixels"""
+    channels = COLOR_CHANNELS[color_type]
+    yield color_type, 8, rows, []
+
+    pixels = [row[i:i + channels] for row in rows for i in range(0, len(row), channels)]
+
+    has_alpha = color_type in (4, 6)
+    if has_alpha and all(p[-1] == 255 for p in pixels):
+        # Fully opaque: drop the alpha channel
+        color_type = 2 if color_type == 6 else 0
+        channels -= 1
+        pixels = [p[:channels] for p in pixels]
+        rows = [b''.join(pixels[y * width:(y + 1) * width]) for y in range(len(rows))]
+        has_alpha = False
+        yield color_type, 8, rows, []
+
+    if color_type in (2, 6) and all(p[0] == p[1] == p[2] for p in pixels):
+        gray_type = 4 if has_alpha else 0
+        gray = [p[:1] + p[3:] for p in pixels]
+        yield gray_type, 8, [b''.join(gray[y * width:(y + 1) * width]) for y in range(len(rows))], []
+
+    colors = {}
+    for p in pixels:
+        if p not in colors:
+            colors[p] = len(colors)
+            if len(colors) > 256:
+                return
+
+    # Translucent entries first, so tRNS can stop at the last one
+    def rgba(p):
+        if color_type in (0, 4):
+            return p[:1] * 3 + (p[1:] if has_alpha else b'\xff')
+        return p[:3] + (p[3:] if has_alpha else b'\xff')
+
+    palette = sorted(colors, key=lambda p: (rgba(p)[3] == 255, rgba(p)))
+    index = {p: i for i, p in enumerate(palette)}
+    plte = b''.join(rgba(p)[:3] for p in palette)
+    alphas = bytes(rgba(p)[3] for p in palette).rstrip(b'\xff')
+    extra = [(b'PLTE', plte)] + ([(b'tRNS', alphas)] if alphas else [])
+
+    indexed = [bytes(index[p] for p in pixels[y * width:(y + 1) * width]) for y in range(len(rows))]
+    depth = next(d for d in (1, 2, 4, 8) if len(palette) <= 1 << d)
+    yield 3, depth, pack_rows(indexed, depth), extra
+
+def compress(data):
+    """Smallest zlib stream over the strategies worth trying at level 9"""
+    best = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        out = compressor.compress(data) + compressor.flush()
+        if best is None or len(out) < len(best):
+            best = out
+    return best
+
+def optimize_png(data, keep_color_profile=False):
+    """Return (optimized bytes, description of the winning encoding)"""
+    chunks = read_chunks(data)
+    header = chunks[0][1]
+    width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', header)
+    kept = KEPT_CHUNKS | (COLOR_CHUNKS if keep_color_profile else set())
+
+    idat = b''.join(body for kind, body in chunks if kind == b'IDAT')
+    palette_chunks = [(kind, body) for kind, body in chunks if kind == b'PLTE']
+    ancillary = [(kind, body) for kind, body in chunks
+                 if kind in kept and not (kind == b'tRNS' and color_type == 3)]
+    trns = [(kind, body) for kind, body in chunks if kind == b'tRNS' and color_type == 3]
+
+    def assemble(ihdr, extra, stream):
+        return (PNG_SIGNATURE + write_chunk(b'IHDR', ihdr)
+                + b''.join(write_chunk(kind, body) for kind, body in extra)
+                + write_chunk(b'IDAT', stream) + write_chunk(b'IEND', b''))
+
+    raw = zlib.decompress(idat)
+    # Always available: the same filtered bytes, chunks stripped and recompressed
+    candidates = [(assemble(header, ancillary + palette_chunks + trns, compress(raw)), 'recompressed')]
+
+    # Pixel-level work needs plain 8-bit, non-interlaced, non-palette images
+    if depth == 8 and interlace == 0 and color_type != 3:
+        bpp = COLOR_CHANNELS[color_type]
+        rows = unfilter(raw, width, height, bpp)
+        # A tRNS color key on gray/RGB has no palette equivalent here; keep the type
+        forms = [next(reductions(rows, width, color_type))] if any(k == b'tRNS' for k, _ in ancillary) \
+            else reductions(rows, width, color_type)
+        for new_type, new_depth, new_rows, extra in forms:
+            new_bpp = max(1, COLOR_CHANNELS[new_type] * new_depth // 8)
+            ihdr = struct.pack('>IIBBBBB', width, height, new_depth, new_type, 0, 0, 0)
+            chunk_list = [c for c in ancillary if c[0] != b'tRNS' or new_type == color_type] + extra
+            for strategy in (0, 1, 2, 3, 4, 'adaptive'):
+                stream = compress(filter_image(new_rows, new_bpp, strategy))
+                name = {0: 'gray', 2: 'rgb', 3: f'palette/{new_depth}bit', 4: 'gray+alpha', 6: 'rgba'}[new_type]
+                label = f"{name}, filter {strategy}"
+                candidates.append((assemble(ihdr, chunk_list, stream), label))
+
+    best, label = min(candidates, key=lambda c: len(c[0]))
+    if len(best) >= len(data):
+        return data, 'original'
+
+    # Never ship a result whose pixels differ from the source
+    if label != 'recompressed' and decode_rgba(best) != decode_rgba(data):
+        raise RuntimeError(f"Lossless check failed ({label})")
+    return best, label
+
+def decode_rgba(data):
+    """Decode an 8-bit or palette, non-interlaced PNG to RGBA rows (to verify a result)"""
+    chunks = read_chunks(data)
+    width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunks[0][1])
+    if interlace or (depth != 8 and color_type != 3):
+        return None
+    plte = b''.join(body for kind, body in chunks if kind == b'PLTE')
+    trns = b''.join(body for kind, body in chunks if kind == b'tRNS')
+    raw = zlib.decompress(b''.join(body for kind, body in chunks if kind == b'IDAT'))
+
+    if color_type == 3:
+        stride = (width * depth + 7) // 8
+        rows = unfilter(raw, stride, height, 1)
+        palette = [plte[i:i + 3] + bytes([trns[i // 3] if i // 3 < len(trns) else 255])
+                   for i in range(0, len(plte), 3)]
+        per_byte = 8 // depth
+        mask = (1 << depth) - 1
+        out = []
+        for row in rows:
+            indices = [(row[x // per_byte] >> (8 - depth * (x % per_byte + 1))) & mask for x in range(width)]
+            out.append(b''.join(palette[i] for i in indices))
+        return out
+
+    channels = COLOR_CHANNELS[color_type]
+    out = []
+    for row in unfilter(raw, width, height, channels):
+        pixels = [row[i:i + channels] for i in range(0, len(row), channels)]
+        if color_type == 0:
+            out.append(b''.join(p * 3 + b'\xff' for p in pixels))
+        elif color_type == 4:
+            out.append(b''.join(p[:1] * 3 + p[1:] for p in pixels))
+        elif color_type == 2:
+            out.append(b''.join(p + b'\xff' for p in pixels))
+        else:
+            out.append(b''.join(pixels))
+    return out
+
+def cache_key(data, keep_color_profile):
+    digest = hashlib.sha256(data)
+    digest.update(f"\0{OPTIMIZER_VERSION}\0{keep_color_profile}".encode('utf-8'))
+    return digest.hexdigest()
+
+def process_image(name, source_dir, output_dir, cache_dir, keep_color_profile):
+    """Optimize one PNG, reusing a cached result for the same input; runs in a worker process"""
+    with open(os.path.join(source_dir, name), 'rb') as f:
+        data = f.read()
+
+    key = cache_key(data, keep_color_profile)
+    cached_path = os.path.join(cache_dir, key + '.png')
+    label_path = os.path.join(cache_dir, key + '.txt')
+    cached = os.path.exists(cached_path) and os.path.exists(label_path)
+
+    if cached:
+        with open(cached_path, 'rb') as f:
+            optimized = f.read()
+        with open(label_path, 'r', encoding='utf-8') as f:
+            label = f.read()
+    else:
+        optimized, label = optimize_png(data, keep_color_profile)
+        for path, content, mode in ((cached_path, optimized, 'wb'), (label_path, label, 'w')):
+            with open(path + '.tmp', mode) as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+    dest = os.path.join(output_dir, name)
+    written = False
+    try:
+        with open(dest, 'rb') as f:
+            written = f.read() != optimized
+    except FileNotFoundError:
+        written = True
+    if written:
+        with open(dest + '.tmp', 'wb') as f:
+            f.write(optimized)
+        os.replace(dest + '.tmp', dest)
+
+    return {
+        'name': name,
+        'original': len(data),
+        'optimized': len(optimized),
+        'label': label,
+        'cached': cached,
+        'data_uri': 'data:image/png;base64,' + base64.b64encode(optimized).decode('ascii')
+                    if len(optimized) <= INLINE_LIMIT else None
+    }
+
+def inline_icons(index_path, results):
+    """Replace href="/favicons/<name>" in index.html with data URIs for small icons"""
+    if not os.path.isfile(index_path):
+        return []
+    with open(index_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    inlined = []
+    for result in results:
+        if not result['data_uri']:
+            continue
+        pattern = re.compile(r'(<link\b[^>]*\bhref=")/favicons/' + re.escape(result['name']) + '"')
+        content, count = pattern.subn(lambda m: m.group(1) + result['data_uri'] + '"', content)
+        if count:
+            inlined.append(result['name'])
+
+    write_text_atomic(index_path, content)
+    return inlined
+
+def main():
+    parser = argparse.ArgumentParser(description='Lossless PNG optimizer for icons')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--no-inline', action='store_true', help='Do not inline small icons in index.html')
+    parser.add_argument('--keep-color-profile', action='store_true',
+                        help='Keep iCCP/sRGB/gAMA/cHRM chunks')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler = BuildProfiler.from_args('optimize-images', args)
+
+    print("\033[33mChecking source files...\033[0m")
+
+    if not os.path.isdir(SOURCE_DIR):
+        print(f"\033[31mMissing directory: {SOURCE_DIR}\033[0m")
+        sys.exit(1)
+
+    images = sorted(name for name in os.listdir(SOURCE_DIR)
+                    if name.lower().endswith('.png') and name not in EXCLUDED_FILES)
+    print(f"\033[32mFound {len(images)} PNG files\033[0m")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    print(f"\n\033[33mOptimizing with {args.jobs} worker(s)...\033[0m")
+
+    with profiler.stage('optimize'):
+        with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+            futures = [pool.submit(process_image, name, SOURCE_DIR, OUTPUT_DIR, CACHE_DIR, args.keep_color_profile)
+                       for name in images]
+            results = [future.result() for future in futures]
+
+    total_original = 0
+    total_optimized = 0
+    for result in results:
+        total_original += result['original']
+        total_optimized += result['optimized']
+        saved = result['original'] - result['optimized']
+        percent = round(saved / result['original'] * 100, 1) if result['original'] else 0
+        source = " (cached)" if result['cached'] else ""
+        print(f"  \033[36m{result['name']}\033[0m")
+        print(f"    \033[90m{round(result['original'] / 1024, 1)} KB -> "
+              f"{round(result['optimized'] / 1024, 1)} KB\033[0m \033[32m-{percent}% ({saved} B)\033[0m "
+              f"\033[90m{result['label']}{source}\033[0m")
+
+    inlined = []
+    if not args.no_inline:
+        with profiler.stage('inline'):
+            inlined = inline_icons(INDEX_HTML, results)
+
+    print("\n" + "=" * 64)
+    print("\033[32mOptimization complete!\033[0m")
+    print("=" * 64)
+
+    saved = total_original - total_optimized
+    percent = round(saved / total_original * 100, 1) if total_original else 0
+    print("\n\033[33mOverall Statistics:\033[0m")
+    print(f"  \033[36mImages:          {len(results)}\033[0m")
+    print(f"  \033[90mOriginal total:  {round(total_original / 1024, 1)} KB\033[0m")
+    print(f"  \033[32mFinal total:     {round(total_optimized / 1024, 1)} KB\033[0m")
+    print(f"  \033[32mSpace saved:     {percent}% ({round(saved / 1024, 1)} KB)\033[0m")
+    if inlined:
+        print(f"  \033[36mInlined:         {', '.join(inlined)} in {INDEX_HTML}\033[0m")
+    print(f"  \033[90mOutput:          {OUTPUT_DIR}\033[0m")
+
+    profiler.report()
+
+    print("\n\033[90mUsage examples:\033[0m")
+    print("  python3 optimize-images.py               # Optimize icons and inline the smallest")
+    print("  python3 optimize-images.py --no-inline   # Leave index.html untouched")
+    print("  python3 optimize-images.py --keep-color-profile  # Keep color profile chunks")
+
+if __name__ == "__main__":
+    main()
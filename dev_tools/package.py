@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Release Packager for Provinent Scripture Study
+Bundles ../www into a reproducible archive: entries are sorted, timestamps,
+owners and permissions are fixed, so the same www/ always gives the same
+bytes. Zip entries are deflated in parallel, and a file with an up-to-date
+.gz sidecar reuses the sidecar's deflate stream instead of compressing again.
+Usage: python3 package.py [--format zip|tar.zst] [--output FILE] [--jobs N]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import struct
+import sys
+import tarfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from build_profile import BuildProfiler, add_profile_arguments
+from size_budget import read_app_version
+
+try:
+    import zstandard
+except ImportError:  # Optional: pip install zstandard (needed for --format tar.zst)
+    zstandard = None
+
+SOURCE_DIR = "../www"
+OUTPUT_DIR = "../archive"
+ARCHIVE_PREFIX = "provinent-scripture-study"
+
+# 1980-01-01, the earliest time a zip entry can hold; SOURCE_DATE_EPOCH overrides it
+DEFAULT_EPOCH = 315532800
+ZSTD_LEVEL = 19
+
+def source_date_epoch():
+    return int(os.environ.get('SOURCE_DATE_EPOCH', DEFAULT_EPOCH))
+
+def collect_files(source_dir, include_sidecars):
+    """Return sorted (archive name, path) pairs for every file under source_dir"""
+    files = []
+    for directory, dirs, names in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in names:
+            if name.startswith('.'):
+                continue
+            if not include_sidecars and name.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(directory, name)
+            files.append((os.path.relpath(path, source_dir).replace(os.sep, '/'), path))
+    # Byte order of the UTF-8 names, independent of locale and file system
+    return sorted(files, key=lambda item: item[0].encode('utf-8'))
+
+def gzip_deflate_stream(gz_path, crc, size):
+    """Return the raw deflate stream of a .gz file if it holds exactly (crc, size), else None"""
+    try:
+        with open(gz_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < 18 or data[:3] != b'\x1f\x8b\x08':
+        return None
+
+    # A truncated or corrupt sidecar is compressed afresh instead
+    try:
+        flags = data[3]
+        pos = 10
+        if flags & 0x04:                   # FEXTRA
+            pos += 2 + struct.unpack('<H', data[pos:pos + 2])[0]
+        for flag in (0x08, 0x10):          # FNAME, FCOMMENT
+            if flags & flag:
+                pos = data.index(b'\0', pos) + 1
+        if flags & 0x02:                   # FHCRC
+            pos += 2
+
+        stored_crc, stored_size = struct.unpack('<II', data[-8:])
+        if stored_crc != crc or stored_size != size & 0xffffffff:
+            return None                    # Stale sidecar
+        # A multi-member .gz cannot be used as one zip entry; check it inflates to the end
+        stream = data[pos:-8]
+        inflater = zlib.decompressobj(-15)
+        inflater.decompress(stream)
+    except (zlib.error, ValueError, struct.error):
+        return None
+    if not inflater.eof or inflater.unused_data:
+        return None
+    return stream
+
+def deflate_entry(name, path):
+    """Compress one file for the zip; runs in a worker thread (zlib releases the GIL)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+
+    if name.endswith(('.gz', '.br')):
+        return {'name': name, 'crc': crc, 'size': len(data), 'method': 0, 'payload': data, 'reused': False}
+
+    stream = gzip_deflate_stream(path + '.gz', crc, len(data))
+    reused = stream is not None
+    if not reused:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+        stream = compressor.compress(data) + compressor.flush()
+
+    if len(stream) >= len(data):
+        return {'name': name, 'crc': crc, 'size': len(data), 'method': 0, 'payload': data, 'reused': False}
+    return {'name': name, 'crc': crc, 'size': len(data), 'method': 8, 'payload': stream, 'reused': reused}
+
+def dos_datetime(epoch):
+    t = time.gmtime(max(epoch, DEFAULT_EPOCH))
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def write_zip(entries, epoch):
+    """Assemble a zip from compressed entries, with nothing that varies between runs"""
+    dos_time, dos_date = dos_datetime(epoch)
+    out = io.BytesIO()
+    central = []
+
+    for entry in entries:
+        name = entry['name'].encode('utf-8')
+        flags = 0x0800 if not entry['name'].isascii() else 0
+        if entry['size'] > 0xffffffff or out.tell() > 0xffffffff:
+            raise ValueError("Archive needs Zip64, which this packager does not write")
+        offset = out.tell()
+        out.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, flags, entry['method'], dos_time, dos_date,
+                              entry['crc'], len(entry['payload']), entry['size'], len(name), 0))
+        out.write(name)
+        out.write(entry['payload'])
+        central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 20, 20, flags, entry['method'],
+                                   dos_time, dos_date, entry['crc'], len(entry['payload']), entry['size'],
+                                   len(name), 0, 0, 0, 0, (0o100644 << 16), offset) + name)
+
+    start = out.tell()
+    for record in central:
+        out.write(record)
+    out.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(central), len(central),
+                          out.tell() - start, start, 0))
+    return out.getvalue()
+
+def write_tar_zst(files, epoch, jobs):
+    """Build a ustar archive with fixed metadata and compress it with zstd on all workers"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        for name, path in files:
+            info = tarfile.TarInfo(name)
+            info.size = os.path.getsize(path)
+            info.mtime = epoch
+            info.mode = 0o644
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            with open(path, 'rb') as f:
+                tar.addfile(info, f)
+
+    # zstd output does not depend on the worker count once it is at least 1
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=max(jobs, 1), write_checksum=True)
+    return compressor.compress(buffer.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproducible release packager')
+    parser.add_argument('--format', choices=('zip', 'tar.zst'), default='zip', help='Archive format (default: zip)')
+    parser.add_argument('--output', help=f'Archive path (default: {OUTPUT_DIR}/{ARCHIVE_PREFIX}-<version>.<format>)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Compression workers (default: CPU count)')
+    parser.add_argument('--no-sidecars', action='store_true', help='Leave .gz/.br sidecar files out of the archive')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler = BuildProfiler.from_args('package', args)
+
+    if args.format == 'tar.zst' and zstandard is None:
+        print("\033[31mtar.zst needs the zstandard package (pip install zstandard)\033[0m")
+        sys.exit(1)
+
+    if not os.path.isdir(SOURCE_DIR):
+        print(f"\033[31mNo build output in {SOURCE_DIR} - run the builders first\033[0m")
+        sys.exit(1)
+
+    version = read_app_version() or 'dev'
+    output = args.output or os.path.join(OUTPUT_DIR, f"{ARCHIVE_PREFIX}-{version}.{args.format}")
+    epoch = source_date_epoch()
+
+    started = time.perf_counter()
+
+    with profiler.stage('collect'):
+        files = collect_files(SOURCE_DIR, not args.no_sidecars)
+    if not files:
+        print(f"\033[31mNo files in {SOURCE_DIR}\033[0m")
+        sys.exit(1)
+    input_size = sum(os.path.getsize(path) for _, path in files)
+
+    print(f"\033[33mPackaging {len(files)} files ({round(input_size / 1024, 1)} KB) "
+          f"as {args.format} with {args.jobs} worker(s)...\033[0m")
+
+    reused = 0
+    if args.format == 'zip':
+        with profiler.stage('compress'):
+            with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+                entries = list(pool.map(lambda item: deflate_entry(*item), files))
+        reused = sum(1 for entry in entries if entry['reused'])
+        with profiler.stage('assemble'):
+            archive = write_zip(entries, epoch)
+    else:
+        with profiler.stage('compress'):
+            archive = write_tar_zst(files, epoch, args.jobs)
+
+    with profiler.stage('write'):
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output + '.tmp', 'wb') as f:
+            f.write(archive)
+        os.replace(output + '.tmp', output)
+
+    elapsed = time.perf_counter() - started
+
+    digest = hashlib.sha256(archive).hexdigest()
+
+    print("\n" + "=" * 64)
+    print("\033[32mPackaging complete!\033[0m")
+    print("=" * 64)
+
+    ratio = round(len(archive) / input_size * 100, 1) if input_size else 0
+    print("\n\033[33mArchive:\033[0m")
+    print(f"  \033[36mFile:            {output}\033[0m")
+    print(f"  \033[32mSize:            {round(len(archive) / 1024, 1)} KB ({ratio}% of {round(input_size / 1024, 1)} KB)\033[0m")
+    print(f"  \033[90mEntries:         {len(files)}\033[0m")
+    if args.format == 'zip':
+        print(f"  \033[90mReused .gz:      {reused}\033[0m")
+    print(f"  \033[90mTimestamp:       {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))} UTC\033[0m")
+    print(f"  \033[90mSHA-256:         {digest}\033[0m")
+    print(f"  \033[32mTime:            {round(elapsed * 1000, 1)} ms\033[0m")
+
+    profiler.report()
+
+    print("\n\033[90mUsage examples:\033[0m")
+    print("  python3 package.py                     # Reproducible zip of ../www")
+    print("  python3 package.py --format tar.zst    # tar.zst (needs the zstandard package)")
+    print("  SOURCE_DATE_EPOCH=1760000000 python3 package.py  # Pin the entry timestamps")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Pre-fork worker supervisor for the Provinent dev HTTPS servers
+# Each worker is a separate process with its own listening socket bound to
+# the same port with SO_REUSEPORT, so the kernel spreads connections across
+# cores instead of one process (and one GIL) handling them all.
+# POSIX only: needs os.fork() and SO_REUSEPORT (Linux, macOS, BSD).
+
+import http.server
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+GRACE_PERIOD = 10      # Seconds a worker gets to finish in-flight requests
+CRASH_WINDOW = 2       # A worker that dies sooner than this after starting...
+MAX_QUICK_CRASHES = 5  # ...this many times in a row stops the supervisor
+
+
+def prefork_supported():
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+class DevHTTPServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTPServer that can share its port with sibling worker processes"""
+
+    # A slow request (such as a cold audio download) must not hold up the
+    # others; non-daemon threads let requests in progress finish on shutdown
+    daemon_threads = False
+    # socketserver's default backlog of 5 drops connections under a burst
+    # of simultaneous sessions before any thread can accept them
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, reuse_port=False):
+        self.reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def serve_until_signalled(httpd):
+    """Serve until SIGTERM/SIGINT, letting the request in progress finish"""
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run
+        # on the thread that is inside serve_forever()
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+def run_supervisor(workers, run_worker):
+    """Fork `workers` processes running run_worker(worker_id) and keep them alive.
+
+    Crashed workers are restarted. SIGTERM or Ctrl+C drains all workers:
+    they are asked to stop, given GRACE_PERIOD seconds, then killed.
+    """
+    children = {}          # pid -> (worker_id, started)
+    stopping = False
+    quick_crashes = 0
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                run_worker(worker_id)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        children[pid] = (worker_id, time.monotonic())
+        print(f"Worker {worker_id} started (pid {pid})")
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+
+    # Poll rather than block in waitpid() so a stop signal is seen promptly
+    while children and not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if not pid:
+            time.sleep(0.2)
+            continue
+        if pid not in children:
+            continue
+
+        worker_id, started = children.pop(pid)
+        code = os.waitstatus_to_exitcode(status)
+        print(f"Worker {worker_id} (pid {pid}) exited with status {code}, restarting")
+
+        quick_crashes = quick_crashes + 1 if time.monotonic() - started < CRASH_WINDOW else 0
+        if quick_crashes >= MAX_QUICK_CRASHES:
+            print("Workers keep failing on startup, stopping")
+            stopping = True
+            break
+        spawn(worker_id)
+
+    # Drain: ask every worker to stop, then wait for them
+    print("\nStopping workers...")
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + GRACE_PERIOD
+    while children and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.1)
+
+    for pid in children:
+        print(f"Worker pid {pid} did not stop in {GRACE_PERIOD}s, killing it")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
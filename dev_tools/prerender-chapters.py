@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Chapter Prerenderer for Provinent Scripture Study
+Renders local chapter JSON (the bible.helloao.org layout,
+<source>/<translation>/<BOOK>/<chapter>.json) into minified HTML fragments
+at ../www/prerendered/<translation>/<BOOK>/<chapter>.html.
+A fragment is the markup displayPassage() in src/modules/passage.js builds
+inside #scriptureContent for the whole chapter, minus the per-user
+highlight-<color> classes, which the client adds after injecting it.
+Only chapters whose JSON changed since the last run are re-rendered.
+Usage: python3 prerender-chapters.py [--source DIR] [--jobs N] [--force]
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from backup_store import write_text_atomic
+from build_profile import BuildProfiler, add_profile_arguments
+
+SOURCE_DIR = "../data/api"
+OUTPUT_DIR = "../www/prerendered"
+STATE_FILE = "../src/modules/state.js"
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the generated markup changes so every chapter is re-rendered
+RENDER_VERSION = 1
+
+def load_book_names(state_file=STATE_FILE):
+    """Map API book codes to the display names used in verse references (bookNameMapping in state.js)"""
+    with open(state_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    match = re.search(r'export const bookNameMapping = \{(.*?)\};', content, re.DOTALL)
+    if not match:
+        raise ValueError(f"bookNameMapping not found in {state_file}")
+
+    pairs = re.findall(r"(?:'([^']+)'|([A-Za-z]+))\s*:\s*'([0-9A-Z]{3})'", match.group(1))
+    return {code: quoted or bare for quoted, bare, code in pairs}
+
+def attr(value):
+    """Escape a value the way the browser serializes an attribute"""
+    return html.escape(str(value), quote=True)
+
+def text(value):
+    """Escape a value the way the browser serializes a text node"""
+    return html.escape(str(value), quote=False)
+
+def escape_html(value):
+    """Python port of escapeHTML() in src/main.js"""
+    return html.escape(str(value), quote=True).replace('&#x27;', '&#39;')
+
+def normalize_space(value):
+    """cleanText() / ensureProperSpacing() in passage.js"""
+    return re.sub(r'\s+', ' ', value or '').strip()
+
+def extract_verse_text(content, chapter_footnotes, counter):
+    """Port of extractVerseText(): verse HTML plus the footnotes it references"""
+    parts = []
+    footnotes = []
+
+    for item in content:
+        if isinstance(item, str):
+            parts.append(normalize_space(item) + ' ')
+        elif not isinstance(item, dict):
+            parts.append(' ')
+        elif item.get('text'):
+            parts.append(normalize_space(item['text']) + ' ')
+        elif item.get('heading'):
+            parts.append(' ' + normalize_space(item['heading']) + ' ')
+        elif 'noteId' in item:
+            footnote = chapter_footnotes.get(item['noteId'])
+            if footnote is None:
+                continue
+            number = counter[0]
+            counter[0] += 1
+            parts.append(f'<sup class="footnote-ref" data-footnote-id="{footnote["noteId"]}" '
+                         f'data-footnote-number="{number}"> {number} </sup>')
+            footnotes.append({'index': footnote['noteId'], 'number': number, 'content': footnote.get('text', '')})
+        elif isinstance(item.get('content'), list):
+            nested_text, nested_footnotes = extract_verse_text(item['content'], chapter_footnotes, counter)
+            parts.append(nested_text)
+            footnotes += nested_footnotes
+        else:
+            parts.append(' ')
+
+    return normalize_space(''.join(parts)), footnotes
+
+def render_chapter(chapter_data, book_name, chapter_number):
+    """Render one chapter's JSON into the markup displayPassage() produces"""
+    chapter = chapter_data['chapter']
+    chapter_footnotes = {fn['noteId']: fn for fn in chapter.get('footnotes') or []}
+    counter = [1]
+    out = []
+    all_footnotes = []
+
+    for item in chapter.get('content', []):
+        item_type = item.get('type')
+        if item_type == 'verse':
+            verse_html, footnotes = extract_verse_text(item['content'], chapter_footnotes, counter)
+            all_footnotes += footnotes
+            plain = normalize_space(re.sub(r'<[^>]*>', '', verse_html))
+            reference = f"{book_name} {chapter_number}:{item['number']}"
+            out.append(
+                f'<div class="verse" data-verse="{attr(reference)}" '
+                f'data-verse-number="{item["number"]}" data-verse-text="{attr(plain)}">'
+                f'<span class="verse-number">{item["number"]}</span>'
+                # innerHTML in the client, so the API text is inserted as-is
+                f'<span class="verse-text">{verse_html}</span></div>'
+            )
+        elif item_type == 'heading':
+            heading = ' '.join(str(part) for part in item.get('content', []))
+            out.append(f'<div class="chapter-heading"><h3>{text(heading)}</h3></div>')
+
+    if all_footnotes:
+        out.append('<hr class="footnotes-separator"><h4 class="footnotes-heading">Footnotes</h4>'
+                   '<div class="footnotes-container">')
+        for fn in sorted(all_footnotes, key=lambda fn: fn['number']):
+            # The client sets textContent = escapeHTML(content), so entities are escaped twice
+            out.append(
+                f'<div class="footnote" data-footnote-id="{attr(fn["index"])}" '
+                f'data-footnote-number="{fn["number"]}">'
+                f'<sup class="footnote-number">{fn["number"]}</sup>'
+                f'<span class="footnote-content">{text(escape_html(fn["content"]))}</span></div>'
+            )
+        out.append('</div>')
+
+    return ''.join(out)
+
+def source_key(raw, book_name):
+    """Cache key for one chapter: its JSON bytes, the display name and the renderer version"""
+    digest = hashlib.sha256(raw)
+    digest.update(f"\0{book_name}\0{RENDER_VERSION}".encode('utf-8'))
+    return digest.hexdigest()
+
+def render_book(translation, book_code, book_name, chapters, source_dir, output_dir, previous, force):
+    """Render the changed chapters of one book; runs in a worker process"""
+    results = []
+
+    for chapter in chapters:
+        rel = f"{translation}/{book_code}/{chapter}"
+        source_path = os.path.join(source_dir, translation, book_code, f"{chapter}.json")
+        dest_path = os.path.join(output_dir, translation, book_code, f"{chapter}.html")
+
+        with open(source_path, 'rb') as f:
+            raw = f.read()
+        key = source_key(raw, book_name)
+
+        if not force and previous.get(rel, {}).get('key') == key and os.path.isfile(dest_path):
+            results.append({'chapter': rel, 'key': key, 'size': previous[rel].get('size', 0), 'status': 'skipped'})
+            continue
+
+        try:
+            fragment = render_chapter(json.loads(raw), book_name, chapter)
+        except (ValueError, KeyError, TypeError) as e:
+            results.append({'chapter': rel, 'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            continue
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        written = write_text_atomic(dest_path, fragment)
+        results.append({
+            'chapter': rel,
+            'key': key,
+            'size': len(fragment.encode('utf-8')),
+            'status': 'rendered' if written else 'unchanged'
+        })
+
+    return results
+
+def scan_sources(source_dir, book_names):
+    """Return {(translation, book code): [chapter numbers]} for every chapter JSON under source_dir"""
+    books = {}
+    unknown = set()
+
+    for translation in sorted(os.listdir(source_dir)):
+        translation_dir = os.path.join(source_dir, translation)
+        if not os.path.isdir(translation_dir):
+            continue
+        for book_code in sorted(os.listdir(translation_dir)):
+            book_dir = os.path.join(translation_dir, book_code)
+            if not os.path.isdir(book_dir):
+                continue
+            if book_code not in book_names:
+                unknown.add(book_code)
+                continue
+            chapters = sorted(int(name[:-5]) for name in os.listdir(book_dir)
+                              if name.endswith('.json') and name[:-5].isdigit())
+            if chapters:
+                books[(translation, book_code)] = chapters
+
+    return books, unknown
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('renderVersion') != RENDER_VERSION:
+        return {}
+    return manifest.get('chapters', {})
+
+def remove_stale(output_dir, previous, current):
+    """Delete fragments whose source chapter no longer exists; returns the count"""
+    removed = 0
+    for rel in sorted(set(previous) - set(current)):
+        path = os.path.join(output_dir, *rel.split('/')) + '.html'
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Prerender chapter JSON into HTML fragments')
+    parser.add_argument('--source', default=SOURCE_DIR,
+                        help=f'Chapter JSON root, <translation>/<BOOK>/<chapter>.json (default: {SOURCE_DIR})')
+    parser.add_argument('--output', default=OUTPUT_DIR, help=f'Fragment output root (default: {OUTPUT_DIR})')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Re-render every chapter')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler = BuildProfiler.from_args('prerender-chapters', args)
+
+    print("\033[33mChecking source files...\033[0m")
+
+    if not os.path.isdir(args.source):
+        print(f"\033[31mChapter JSON directory not found: {args.source}\033[0m")
+        sys.exit(1)
+
+    with profiler.stage('scan'):
+        book_names = load_book_names()
+        books, unknown = scan_sources(args.source, book_names)
+        manifest_path = os.path.join(args.output, MANIFEST_NAME)
+        previous = load_manifest(manifest_path)
+
+    for code in sorted(unknown):
+        print(f"  \033[33mSkipping unknown book code: {code}\033[0m")
+
+    if not books:
+        print(f"\033[31mNo chapter JSON found under {args.source}\033[0m")
+        sys.exit(1)
+
+    total_chapters = sum(len(chapters) for chapters in books.values())
+    translations = sorted({translation for translation, _ in books})
+    print(f"\033[32mFound {total_chapters} chapters in {len(books)} books "
+          f"({', '.join(translations)})\033[0m")
+
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f"\n\033[33mRendering with {args.jobs} worker(s)...\033[0m")
+
+    results = []
+    with profiler.stage('render'):
+        # One task per book keeps chapters of a book together and the pool busy
+        with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+            futures = []
+            for (translation, book_code), chapters in books.items():
+                prefix = f"{translation}/{book_code}/"
+                book_previous = {rel: entry for rel, entry in previous.items() if rel.startswith(prefix)}
+                futures.append(pool.submit(
+                    render_book, translation, book_code, book_names[book_code], chapters,
+                    args.source, args.output, book_previous, args.force))
+            for future in futures:
+                results += future.result()
+
+    counts = {'rendered': 0, 'unchanged': 0, 'skipped': 0, 'error': 0}
+    chapters = {}
+    total_size = 0
+    for result in results:
+        counts[result['status']] += 1
+        if result['status'] == 'error':
+            print(f"  \033[31m{result['chapter']}: {result['error']}\033[0m")
+            continue
+        chapters[result['chapter']] = {'key': result['key'], 'size': result['size']}
+        total_size += result['size']
+
+    with profiler.stage('manifest'):
+        removed = remove_stale(args.output, previous, chapters)
+        manifest = {
+            'renderVersion': RENDER_VERSION,
+            'chapters': dict(sorted(chapters.items()))
+        }
+        write_text_atomic(manifest_path, json.dumps(manifest, indent=1) + "\n")
+
+    print("\n" + "=" * 64)
+    print("\033[32mPrerendering complete!\033[0m")
+    print("=" * 64)
+
+    print("\n\033[33mOverall Statistics:\033[0m")
+    print(f"  \033[36mChapters:        {total_chapters}\033[0m")
+    print(f"  \033[32mRendered:        {counts['rendered']}\033[0m")
+    print(f"  \033[90mUp to date:      {counts['skipped'] + counts['unchanged']}\033[0m")
+    print(f"  \033[90mRemoved:         {removed}\033[0m")
+    print(f"  \033[90mFragments total: {round(total_size / 1024, 1)} KB\033[0m")
+    print(f"  \033[90mOutput:          {args.output}\033[0m")
+    if counts['error']:
+        print(f"  \033[31mFailed:          {counts['error']}\033[0m")
+
+    profiler.report()
+
+    print("\n\033[90mUsage examples:\033[0m")
+    print("  python3 prerender-chapters.py                   # Render changed chapters")
+    print("  python3 prerender-chapters.py --source DIR      # Read chapter JSON from DIR")
+    print("  python3 prerender-chapters.py --force --jobs 4  # Re-render everything with 4 workers")
+
+    if counts['error']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Release history and delta patches for the Provinent Scripture Study service worker
+build-sw.py records the assets of every build under ../releases and, for each
+asset that changed since a kept release, writes a patch from the old content
+to the new one into ../www/patches/<old revision>-<new revision>.bin.
+The service worker applies a patch to the copy it already has instead of
+downloading the whole file.
+
+Patch format (applyPatch() in src/sw.js):
+  b'PVD1', varint target length, then operations until the end:
+    0x00 varint offset, varint length   copy bytes from the old file
+    0x01 varint length, bytes           insert literal bytes
+Usage: python3 release_patches.py --diff OLD NEW   # patch size for two files
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+from backup_store import write_text_atomic
+
+RELEASE_ROOT = "../releases"
+INDEX_SCHEMA = 1
+DEFAULT_HISTORY = 3        # Previous releases clients can patch from
+DEFAULT_THRESHOLD = 0.5    # Patch must be at most this fraction of the gzipped file
+PATCH_MAGIC = b'PVD1'
+BLOCK_SIZE = 16            # Shortest run of old bytes worth a copy
+REVISION_LENGTH = 12       # Hex digits of SHA-256 used as the asset revision (see build-sw.py)
+
+def add_patch_arguments(parser):
+    """Add the delta patch options"""
+    parser.add_argument('--no-patches', action='store_true', help='Do not write delta patches')
+    parser.add_argument('--patch-history', type=int, default=DEFAULT_HISTORY,
+                        help=f'Previous releases to write patches from (default: {DEFAULT_HISTORY})')
+    parser.add_argument('--patch-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Largest patch, as a fraction of the gzipped full file, '
+                             f'before clients download the full file instead (default: {DEFAULT_THRESHOLD})')
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def decode_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def make_patch(old, new, block=BLOCK_SIZE):
+    """Return a patch that turns the bytes old into the bytes new"""
+    # First position of every block in the old file
+    index = {}
+    for i in range(len(old) - block + 1):
+        index.setdefault(old[i:i + block], i)
+
+    out = bytearray(PATCH_MAGIC + encode_varint(len(new)))
+    pending = bytearray()
+    j = 0
+
+    def flush():
+        if pending:
+            out.extend(b'\x01' + encode_varint(len(pending)) + pending)
+            pending.clear()
+
+    while j < len(new):
+        start = index.get(new[j:j + block]) if j + block <= len(new) else None
+        if start is None:
+            pending.append(new[j])
+            j += 1
+            continue
+
+        # Grow the match forwards, then backwards into the pending literals
+        length = block
+        while j + length < len(new) and start + length < len(old) and old[start + length] == new[j + length]:
+            length += 1
+        back = 0
+        while back < len(pending) and back < start and old[start - back - 1] == pending[-back - 1]:
+            back += 1
+        if back:
+            del pending[-back:]
+
+        flush()
+        out.extend(b'\x00' + encode_varint(start - back) + encode_varint(length + back))
+        j += length
+
+    flush()
+    return bytes(out)
+
+def apply_patch(old, patch):
+    """Apply a patch from make_patch() to old; mirrors applyPatch() in sw.js"""
+    if patch[:4] != PATCH_MAGIC:
+        raise ValueError("Not a delta patch")
+    size, pos = decode_varint(patch, 4)
+    out = bytearray()
+
+    while pos < len(patch):
+        op = patch[pos]
+        pos += 1
+        if op == 0:
+            start, pos = decode_varint(patch, pos)
+            length, pos = decode_varint(patch, pos)
+            out += old[start:start + length]
+        elif op == 1:
+            length, pos = decode_varint(patch, pos)
+            out += patch[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Unknown patch operation {op}")
+
+    if len(out) != size:
+        raise ValueError(f"Patch produced {len(out)} bytes, expected {size}")
+    return bytes(out)
+
+def gzip_size(data):
+    return len(gzip.compress(data, compresslevel=9, mtime=0))
+
+class ReleaseStore:
+    """Content of every asset in the last few builds, stored by SHA-256"""
+
+    def __init__(self, root=RELEASE_ROOT, history=DEFAULT_HISTORY):
+        self.root = root
+        self.history = history
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        self.releases = []
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.releases = json.load(f).get('releases', [])
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def read(self, digest):
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def previous(self, assets):
+        """Kept releases that differ from the current assets, newest first"""
+        return [release for release in reversed(self.releases) if release['assets'] != assets]
+
+    def record(self, version, assets, files):
+        """Store this build's assets ({url: digest}, read from {url: path}) as the newest release.
+
+        Returns False if the newest release already has exactly these assets.
+        """
+        if self.releases and self.releases[-1]['assets'] == assets:
+            return False
+
+        for url, digest in assets.items():
+            blob = self.object_path(digest)
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                # Copy beside the blob and rename, so a reader never sees a partial file
+                shutil.copyfile(files[url], blob + '.tmp')
+                os.replace(blob + '.tmp', blob)
+
+        self.releases.append({
+            'version': version,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'assets': assets
+        })
+        # The current release plus `history` earlier ones
+        self.releases = self.releases[-(self.history + 1):]
+        self.prune()
+        return True
+
+    def prune(self):
+        """Delete blobs no kept release refers to and save the index"""
+        referenced = {digest for release in self.releases for digest in release['assets'].values()}
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for rest in os.listdir(prefix_dir):
+                    if prefix + rest not in referenced:
+                        os.remove(os.path.join(prefix_dir, rest))
+                if not os.listdir(prefix_dir):
+                    os.rmdir(prefix_dir)
+
+        os.makedirs(self.root, exist_ok=True)
+        write_text_atomic(self.index_path, json.dumps(
+            {'schema': INDEX_SCHEMA, 'releases': self.releases}, indent=2) + '\n')
+
+def build_patches(store, assets, files, patches_dir, threshold=DEFAULT_THRESHOLD):
+    """Make patches from each kept release to the current assets, without writing them.
+
+    Returns ({url: [old revisions with a patch]}, report rows, {patch name:
+    bytes} for save_patches()). Patches already in patches_dir are reused.
+    """
+    available = {}
+    report = []
+    patches = {}
+
+    for release in store.previous(assets):
+        row = {'version': release['version'], 'changed': 0, 'full': 0, 'patched': 0, 'patches': 0}
+
+        for url, digest in assets.items():
+            old_digest = release['assets'].get(url)
+            if old_digest is None or old_digest == digest:
+                continue
+
+            with open(files[url], 'rb') as f:
+                new = f.read()
+            full = gzip_size(new)
+            row['changed'] += 1
+            row['full'] += full
+
+            old_rev, new_rev = old_digest[:REVISION_LENGTH], digest[:REVISION_LENGTH]
+            name = f"{old_rev}-{new_rev}.bin"
+            path = os.path.join(patches_dir, name)
+
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    patch = f.read()
+            else:
+                old = store.read(old_digest)
+                patch = make_patch(old, new)
+                # Never publish a patch that does not rebuild the file exactly
+                if apply_patch(old, patch) != new:
+                    raise RuntimeError(f"Patch {name} for {url} does not round-trip")
+
+            if len(patch) > full * threshold:
+                row['patched'] += full
+                continue
+
+            patches[name] = patch
+            available.setdefault(url, []).append(old_rev)
+            row['patched'] += len(patch)
+            row['patches'] += 1
+
+        report.append(row)
+
+    return available, report, patches
+
+def save_patches(patches_dir, patches):
+    """Write the patches from build_patches() that patches_dir does not have yet"""
+    os.makedirs(patches_dir, exist_ok=True)
+    for name, patch in patches.items():
+        path = os.path.join(patches_dir, name)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(patch)
+            os.replace(path + '.tmp', path)
+
+def remove_stale_patches(patches_dir, wanted):
+    """Delete the patches in patches_dir that are not in wanted; call once the new sw.js is written.
+
+    Patches no longer needed stay until then, as the deployed service
+    worker may still use them.
+    """
+    removed = 0
+    for name in os.listdir(patches_dir):
+        if name not in wanted:
+            os.remove(os.path.join(patches_dir, name))
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Delta patch tool')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), required=True,
+                        help='Report the patch size from OLD to NEW')
+    args = parser.parse_args()
+
+    with open(args.diff[0], 'rb') as f:
+        old = f.read()
+    with open(args.diff[1], 'rb') as f:
+        new = f.read()
+
+    patch = make_patch(old, new)
+    if apply_patch(old, patch) != new:
+        print("\033[31mPatch does not round-trip\033[0m")
+        sys.exit(1)
+
+    full = gzip_size(new)
+    print(f"\033[36mNew file:\033[0m {len(new)} B raw, {full} B gzip")
+    print(f"\033[36mPatch:\033[0m    {len(patch)} B raw, {gzip_size(patch)} B gzip")
+    print(f"\033[32mSaved:\033[0m    {full - len(patch)} B ({round((1 - len(patch) / full) * 100, 1) if full else 0}%)")
+
+if __name__ == "__main__":
+    main()
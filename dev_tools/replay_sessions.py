@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Reading-session replay harness for Provinent Scripture Study
+Replays scripted navigation traces as the HTTP requests the app makes: the
+app shell and its modules from https_server.py, chapter JSON in the
+fetchChapter() URL format, then chapter audio. A local stub stands in for
+bible.helloao.org, the audio origins and the verse analysis sites, so runs
+are repeatable and need no network. Reports p50/p95/p99 latency and bytes
+per step and per session.
+Usage: python3 replay_sessions.py [--users 20] [--concurrency 4] [--trace FILE]
+"""
+
+import argparse
+import http.client
+import http.server
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import posixpath
+import random
+import re
+import signal
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from audio_cache import AUDIO_ROUTE, KJV_BOOKS, parse_range
+from bench_server import server_workdir, wait_for_server
+
+DEV_TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(DEV_TOOLS_DIR)
+STATE_FILE = os.path.join(REPO_ROOT, "src", "modules", "state.js")
+
+# translationMap in src/modules/api.js
+API_TRANSLATIONS = {'BSB': 'BSB', 'KJV': 'eng_kjv', 'NET': 'eng_net', 'ASV': 'eng_asv', 'GNV': 'eng_gnv'}
+BSB_NARRATORS = ('gilbert', 'hays', 'souer')
+MAX_FAILURES_SHOWN = 8
+
+# Open Genesis 1, read on with Alt+Right, switch to the KJV, listen, analyse a verse
+DEFAULT_TRACE = {
+    'name': 'study-session',
+    'steps': [
+        {'name': 'load app', 'action': 'load'},
+        {'name': 'open Genesis 1', 'action': 'open', 'translation': 'BSB', 'book': 'Genesis', 'chapter': 1},
+        {'name': 'next chapter (Alt+Right)', 'action': 'next', 'repeat': 10},
+        {'name': 'play audio (BSB)', 'action': 'audio'},
+        {'name': 'switch to KJV', 'action': 'translation', 'translation': 'KJV'},
+        {'name': 'play audio (KJV)', 'action': 'audio'},
+        {'name': 'verse analysis', 'action': 'analysis', 'verse': 1}
+    ]
+}
+
+LINK_TAG = re.compile(r'<(?:script|link)\b[^>]*>', re.IGNORECASE)
+LINK_ATTR = re.compile(r'\b(?:src|href)\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+LINK_REL = re.compile(r'\brel\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+FETCHED_RELS = {'stylesheet', 'icon', 'apple-touch-icon', 'manifest', 'modulepreload', 'preload'}
+JS_IMPORT = re.compile(r'''(?:\bfrom|\bimport)\s*\(?\s*['"]([^'"]+\.js)['"]''')
+SW_REGISTER = re.compile(r'''serviceWorker\.register\(\s*['"]([^'"]+)['"]''')
+
+WORDS = ("and God said let there be light in the beginning created heavens earth was without form "
+         "void darkness over face of deep Spirit moving waters saw that it good separated day night").split()
+
+def load_books():
+    """Return [(display name, API code, KJV audio code, chapters)] in canonical order"""
+    path = os.path.join(DEV_TOOLS_DIR, "prerender-chapters.py")
+    spec = importlib.util.spec_from_file_location("prerender_chapters", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # bookNameMapping and KJV_BOOKS are both in canonical order
+    names = module.load_book_names(STATE_FILE)
+    return [(name, code, kjv, chapters) for (code, name), (kjv, chapters) in zip(names.items(), KJV_BOOKS)]
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+# ---------------------------------------------------------------------------
+# Upstream stub
+# ---------------------------------------------------------------------------
+
+def stub_chapter(origin, translation, book, chapter, verses):
+    """A chapter in the bible.helloao.org response shape, the same bytes on every call"""
+    rng = random.Random(f"{translation}/{book}/{chapter}")
+    content = [{'type': 'heading', 'content': [f"{book} {chapter}"]}]
+    for number in range(1, verses + 1):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(14, 34)))
+        content.append({'type': 'verse', 'number': number, 'content': [text.capitalize() + '.']})
+
+    data = {
+        'translation': {'id': translation, 'name': translation, 'shortName': translation},
+        'book': {'id': book, 'name': book, 'commonName': book},
+        'chapter': {'number': chapter, 'content': content, 'footnotes': []},
+        'numberOfVerses': verses,
+        'thisChapterAudioLinks': {}
+    }
+    if translation == 'BSB':
+        data['thisChapterAudioLinks'] = {
+            narrator: f"{origin}/audio/bsb/{narrator}/BSB_{book}_{chapter:03d}.mp3" for narrator in BSB_NARRATORS
+        }
+    return json.dumps(data).encode('utf-8')
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Serves chapter JSON, MP3s and stand-in pages; settings live on the server"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+
+        path = self.path.split('?', 1)[0]
+        match = re.match(r'^/api/([^/]+)/([^/]+)/(\d+)\.json$', path)
+        if match:
+            body = stub_chapter(server.origin, match.group(1), match.group(2), int(match.group(3)), server.verses)
+            return self.send_body(200, 'application/json', body)
+
+        if path.startswith('/audio/') and path.endswith('.mp3'):
+            size = len(server.audio)
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size)
+            except ValueError:
+                return self.send_body(416, 'text/plain', b'')
+            start, end = byte_range or (0, size - 1)
+            return self.send_body(206 if byte_range else 200, 'audio/mpeg', server.audio[start:end + 1],
+                                  {'Content-Range': f"bytes {start}-{end}/{size}"} if byte_range else None)
+
+        # Interlinear and STEP Bible pages shown in the verse analysis popup
+        return self.send_body(200, 'text/html; charset=utf-8', server.page)
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(port, delay_ms, verses, audio_kb, page_kb):
+    """Start the upstream stub on a background thread"""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.origin = f"http://127.0.0.1:{server.server_address[1]}"
+    server.delay = delay_ms / 1000
+    server.verses = verses
+    server.audio = bytes(random.Random(0).getrandbits(8) for _ in range(audio_kb * 1024))
+    server.page = b'<!DOCTYPE html><html><body>' + b'x' * (page_kb * 1024) + b'</body></html>'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ---------------------------------------------------------------------------
+# Simulated user
+# ---------------------------------------------------------------------------
+
+class Session:
+    """One simulated user replaying a trace; requests within a step run in parallel"""
+
+    def __init__(self, config):
+        self.config = config
+        self.context = ssl._create_unverified_context()
+        self.books = config['books']
+        self.book_index = {name: i for i, (name, *_rest) in enumerate(self.books)}
+        self.pool = ThreadPoolExecutor(max_workers=config['connections'])
+        self.translation = 'BSB'
+        self.book = self.books[0][0]
+        self.chapter = 1
+        self.chapter_data = None
+        self.failed = []
+
+    def request(self, url, headers=None):
+        """GET url on a new connection; returns (ok, body bytes)"""
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        try:
+            if parts.scheme == 'https':
+                conn = http.client.HTTPSConnection(parts.hostname, parts.port, context=self.context, timeout=30)
+            else:
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+            conn.request('GET', path, headers=headers or {})
+            response = conn.getresponse()
+            body = response.read()
+            conn.close()
+        except OSError as e:
+            self.failed.append(f"{type(e).__name__} {url}")
+            return False, b''
+        if response.status >= 400:
+            self.failed.append(f"{response.status} {url}")
+            return False, body
+        return True, body
+
+    def fetch_all(self, urls, headers=None):
+        """Fetch urls in parallel, as many at once as a browser opens connections"""
+        return list(self.pool.map(lambda url: self.request(url, headers), urls))
+
+    def chapter_url(self):
+        """fetchChapter(): <API_BASE_URL>/<translation>/<BOOK>/<chapter>.json"""
+        code = self.books[self.book_index[self.book]][1]
+        return f"{self.config['api_base']}/{API_TRANSLATIONS.get(self.translation, self.translation)}/{code}/{self.chapter}.json"
+
+    def audio_url(self, narrator=None):
+        if self.translation == 'KJV':
+            # getKJVAudioLink(), mirrored by the dev server at /audio/kjv/
+            kjv = self.books[self.book_index[self.book]][2]
+            return f"{self.config['app_origin']}{AUDIO_ROUTE}KJV_{kjv}_{self.chapter:03d}.mp3"
+        links = (self.chapter_data or {}).get('thisChapterAudioLinks') or {}
+        return links.get(narrator) or next(iter(links.values()), None)
+
+    def load_app(self):
+        """index.html, the assets it links, then the module graph breadth first"""
+        origin = self.config['app_origin']
+        seen = {'/'}
+        wave = ['/']
+        results = []
+
+        while wave:
+            responses = self.fetch_all([origin + path for path in wave])
+            results += responses
+            found = []
+            for path, (ok, body) in zip(wave, responses):
+                if ok:
+                    found += self.linked_paths(path, body.decode('utf-8', 'replace'))
+            wave = [path for path in dict.fromkeys(found) if path not in seen]
+            seen.update(wave)
+        return results
+
+    def linked_paths(self, base, text):
+        """Same-origin paths a browser fetches next from an HTML or JS response"""
+        if base == '/' or base.endswith('.html'):
+            specs = []
+            for tag in LINK_TAG.findall(text):
+                rel = LINK_REL.search(tag)
+                if tag[1:5].lower() == 'link' and not (rel and FETCHED_RELS & set(rel.group(1).lower().split())):
+                    continue
+                specs += LINK_ATTR.findall(tag)
+        elif base.endswith('.js'):
+            specs = JS_IMPORT.findall(text) + SW_REGISTER.findall(text)
+        else:
+            return []
+
+        paths = []
+        for spec in specs:
+            if spec.startswith(('//', 'data:')) or re.match(r'^[a-z][a-z0-9+.-]*:', spec, re.IGNORECASE):
+                continue
+            if not spec.startswith('/'):
+                spec = posixpath.normpath(posixpath.join(posixpath.dirname(base), spec))
+            paths.append(spec)
+        return paths
+
+    def load_chapter(self):
+        ok, body = self.request(self.chapter_url(), {'Accept': 'application/json', 'Cache-Control': 'no-cache'})
+        if ok:
+            try:
+                self.chapter_data = json.loads(body)
+            except ValueError:
+                ok = False
+        return [(ok, body)]
+
+    def run_step(self, step):
+        """Perform one step; returns [(ok, body)] or None when the app would not request anything"""
+        action = step['action']
+        if action == 'load':
+            return self.load_app()
+
+        if action == 'open':
+            self.translation = step.get('translation', self.translation)
+            self.book = step.get('book', self.book)
+            self.chapter = int(step.get('chapter', 1))
+            return self.load_chapter()
+
+        if action == 'next':
+            # calculateNextPassage(): next chapter, or chapter 1 of the next book
+            index = self.book_index[self.book]
+            if self.chapter < self.books[index][3]:
+                self.chapter += 1
+            elif index + 1 < len(self.books):
+                self.book, self.chapter = self.books[index + 1][0], 1
+            else:
+                return None
+            return self.load_chapter()
+
+        if action == 'translation':
+            self.translation = step['translation']
+            return self.load_chapter()
+
+        if action == 'audio':
+            url = self.audio_url(step.get('narrator'))
+            if not url:
+                return None
+            # The player starts once it has buffered the opening of the file
+            return [self.request(url, {'Range': f"bytes=0-{self.config['audio_bytes'] - 1}"})]
+
+        if action == 'analysis':
+            # showStrongsReference(): Bible Hub interlinear and STEP Bible frames
+            verse = int(step.get('verse', 1))
+            reference = f"{self.book} {self.chapter}:{verse}"
+            stub = self.config['stub_origin']
+            return self.fetch_all([
+                f"{stub}/interlinear/{self.book.replace(' ', '_').lower()}/{self.chapter}-{verse}.htm",
+                f"{stub}/?q=version={self.translation}@reference={quote(reference)}&options=HNVUG"
+            ])
+
+        raise ValueError(f"Unknown trace action: {action}")
+
+    def replay(self, trace):
+        """Replay every step of trace; returns the step results"""
+        steps = []
+        try:
+            for step in trace['steps']:
+                for _ in range(int(step.get('repeat', 1))):
+                    start = time.perf_counter()
+                    results = self.run_step(step)
+                    elapsed = time.perf_counter() - start
+                    if results is None:
+                        continue
+                    steps.append({
+                        'name': step['name'],
+                        'seconds': elapsed,
+                        'bytes': sum(len(body) for _, body in results),
+                        'requests': len(results),
+                        'errors': sum(1 for ok, _ in results if not ok),
+                        'failed': self.failed
+                    })
+                    self.failed = []
+                    if self.config['think']:
+                        time.sleep(self.config['think'])
+        finally:
+            self.pool.shutdown()
+        return steps
+
+def run_session(args):
+    config, trace = args
+    return Session(config).replay(trace)
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def summarize(name, seconds, sizes, requests=0, errors=0):
+    seconds = sorted(seconds)
+    return {
+        'name': name,
+        'samples': len(seconds),
+        'p50_ms': percentile(seconds, 50) * 1000,
+        'p95_ms': percentile(seconds, 95) * 1000,
+        'p99_ms': percentile(seconds, 99) * 1000,
+        'avg_kb': sum(sizes) / len(sizes) / 1024 if sizes else 0,
+        'requests': requests,
+        'errors': errors
+    }
+
+def build_report(sessions):
+    """Per-step rows in trace order, then the whole-session row"""
+    by_step = {}
+    for steps in sessions:
+        for step in steps:
+            by_step.setdefault(step['name'], []).append(step)
+
+    rows = [summarize(name, [s['seconds'] for s in steps], [s['bytes'] for s in steps],
+                      sum(s['requests'] for s in steps), sum(s['errors'] for s in steps))
+            for name, steps in by_step.items()]
+    session_row = summarize('whole session',
+                            [sum(s['seconds'] for s in steps) for steps in sessions],
+                            [sum(s['bytes'] for s in steps) for steps in sessions],
+                            sum(row['requests'] for row in rows), sum(row['errors'] for row in rows))
+    return rows, session_row
+
+def print_row(row, color=''):
+    reset = '\033[0m' if color else ''
+    print(f"{color}{row['name'][:26]:<26} {row['samples']:>7} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+          f"{row['p99_ms']:>9.1f} {row['avg_kb']:>9.1f} {row['requests']:>8} {row['errors']:>6}{reset}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Reading-session replay harness')
+    parser.add_argument('--users', type=int, default=20, help='Sessions to replay (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Sessions running at once (default: 4)')
+    parser.add_argument('--connections', type=int, default=6,
+                        help='Parallel requests per simulated browser (default: 6)')
+    parser.add_argument('--trace', help='JSON trace file (default: the built-in study session)')
+    parser.add_argument('--think', type=float, default=0, help='Pause between steps in seconds (default: 0)')
+    parser.add_argument('--workers', type=int, default=1, help='https_server.py --workers (default: 1)')
+    parser.add_argument('--port', type=int, default=8545, help='Port for the dev server (default: 8545)')
+    parser.add_argument('--stub-port', type=int, default=0, help='Port for the upstream stub (default: any free port)')
+    parser.add_argument('--stub-delay', type=float, default=0,
+                        help='Milliseconds the stub waits before answering, for upstream latency (default: 0)')
+    parser.add_argument('--verses', type=int, default=31, help='Verses per stub chapter (default: 31)')
+    parser.add_argument('--audio-kb', type=int, default=1024, help='Size of each stub MP3 in KB (default: 1024)')
+    parser.add_argument('--audio-buffer-kb', type=int, default=256,
+                        help='Audio bytes a step waits for before playback starts (default: 256)')
+    parser.add_argument('--page-kb', type=int, default=48, help='Size of the stand-in analysis pages in KB (default: 48)')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(REPO_ROOT, 'www', 'index.html')):
+        print(f"\033[31mNo build in {os.path.join(REPO_ROOT, 'www')} - run the builders first\033[0m")
+        sys.exit(1)
+
+    trace = DEFAULT_TRACE
+    if args.trace:
+        with open(args.trace, 'r', encoding='utf-8') as f:
+            trace = json.load(f)
+
+    stub = start_stub(args.stub_port, args.stub_delay, args.verses, args.audio_kb, args.page_kb)
+
+    workdir = server_workdir('provinent-replay-')
+    # Startup errors go to stdout or stderr; keep both to show on failure
+    server_log = tempfile.TemporaryFile(mode='w+', encoding='utf-8', errors='replace')
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(DEV_TOOLS_DIR, 'https_server.py'),
+         '--port', str(args.port), '--workers', str(args.workers),
+         '--audio-origin', f"{stub.origin}/audio/kjv",
+         '--audio-cache', os.path.join(workdir.name, 'audio-cache')],
+        cwd=workdir.name, stdout=server_log, stderr=subprocess.STDOUT)
+
+    config = {
+        'app_origin': f"https://localhost:{args.port}",
+        'api_base': f"{stub.origin}/api",
+        'stub_origin': stub.origin,
+        'books': load_books(),
+        'connections': max(args.connections, 1),
+        'audio_bytes': args.audio_buffer_kb * 1024,
+        'think': args.think
+    }
+
+    print(f"\033[33mReplaying '{trace.get('name', args.trace)}': {args.users} sessions, "
+          f"{args.concurrency} at a time, {args.workers} server worker(s)\033[0m")
+    print(f"\033[90mDev server: {config['app_origin']}  Upstream stub: {stub.origin} "
+          f"(+{args.stub_delay:g} ms)\033[0m")
+
+    try:
+        if not wait_for_server(args.port):
+            print("\033[31mServer did not start (are certificates and the cryptography package available?)\033[0m")
+            server_log.seek(0)
+            for line in server_log.read().splitlines()[-20:]:
+                print(f"\033[90m  {line}\033[0m")
+            sys.exit(1)
+
+        started = time.monotonic()
+        with multiprocessing.Pool(max(args.concurrency, 1)) as pool:
+            sessions = pool.map(run_session, [(config, trace)] * args.users, chunksize=1)
+        elapsed = time.monotonic() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        stub.shutdown()
+        server_log.close()
+        workdir.cleanup()
+
+    rows, session_row = build_report(sessions)
+
+    print("\n" + "=" * 64)
+    print("\033[32mReplay complete!\033[0m")
+    print("=" * 64)
+
+    print(f"\n\033[33m{'Step':<26} {'Samples':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'Avg KB':>9} {'Requests':>8} {'Errors':>6}\033[0m")
+    for row in rows:
+        print_row(row)
+    print_row(session_row, '\033[36m')
+
+    print(f"\n\033[33mOverall Statistics:\033[0m")
+    print(f"  \033[36mSessions:        {len(sessions)} in {round(elapsed, 2)} s "
+          f"({round(len(sessions) / elapsed, 2) if elapsed else 0}/s)\033[0m")
+    print(f"  \033[36mRequests:        {session_row['requests']}\033[0m")
+    total_kb = session_row['avg_kb'] * len(sessions)
+    print(f"  \033[32mTransferred:     {round(total_kb / 1024, 2)} MB ({round(session_row['avg_kb'], 1)} KB per session)\033[0m")
+    color = '\033[31m' if session_row['errors'] else '\033[90m'
+    print(f"  {color}Errors:          {session_row['errors']}\033[0m")
+    failures = Counter(failure for steps in sessions for step in steps for failure in step['failed'])
+    for failure, count in failures.most_common(MAX_FAILURES_SHOWN):
+        print(f"    \033[31m{count:>5} x {failure}\033[0m")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'trace': trace.get('name'), 'users': args.users, 'concurrency': args.concurrency,
+                       'workers': args.workers, 'seconds': elapsed,
+                       'steps': rows, 'session': session_row}, f, indent=2)
+        print(f"\n\033[90mReport written to {args.json}\033[0m")
+
+    print("\n\033[90mUsage examples:\033[0m")
+    print("  python3 replay_sessions.py                              # 20 study sessions, 4 at a time")
+    print("  python3 replay_sessions.py --users 100 --concurrency 16 --workers 4")
+    print("  python3 replay_sessions.py --stub-delay 80              # Upstream API 80 ms away")
+    print("  python3 replay_sessions.py --trace my-trace.json --json report.json")
+
+if __name__ == "__main__":
+    main()
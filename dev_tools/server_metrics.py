@@ -0,0 +1,162 @@
+# Request metrics and access logging for the Provinent dev HTTPS servers
+# Metrics are kept in memory and exported in the Prometheus text format;
+# access log lines are handed to a background thread instead of printed
+# on the request path.
+
+import bisect
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+METRICS_ROUTE = "/__metrics"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class CountingWriter:
+    """Wraps a handler's wfile and counts the bytes written through it"""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self._wfile.write(data)
+
+    def add(self, count):
+        """Account for bytes sent around the writer, e.g. with sendfile()"""
+        self.written += count
+
+    def __getattr__(self, name):
+        return getattr(self._wfile, name)
+
+
+class ServerMetrics:
+    """Thread-safe counters and latency histograms keyed by route
+
+    Every series carries a worker label: pre-forked workers each keep their
+    own counters, and a scrape is answered by whichever worker accepts it.
+    """
+
+    def __init__(self, worker=0):
+        self._lock = threading.Lock()
+        self.worker = f'worker="{worker}"'
+        self.started = time.time()
+        self.requests = {}       # (route, method, status) -> count
+        self.latency = {}        # (route, method) -> [bucket counts..., +Inf]
+        self.latency_sum = {}    # (route, method) -> seconds
+        self.bytes_sent = {}     # route -> bytes
+        self.spa_fallbacks = 0
+        self.audio_cache = {'hit': 0, 'miss': 0}
+
+    def observe(self, route, method, status, seconds, bytes_sent):
+        """Record one finished request"""
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        key = (route, method)
+
+        with self._lock:
+            status_key = (route, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+            counts = self.latency.get(key)
+            if counts is None:
+                counts = self.latency[key] = [0] * (len(LATENCY_BUCKETS) + 1)
+            counts[bucket] += 1
+            self.latency_sum[key] = self.latency_sum.get(key, 0.0) + seconds
+
+            self.bytes_sent[route] = self.bytes_sent.get(route, 0) + bytes_sent
+
+    def count_spa_fallback(self):
+        with self._lock:
+            self.spa_fallbacks += 1
+
+    def count_audio_cache(self, hit):
+        with self._lock:
+            self.audio_cache['hit' if hit else 'miss'] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = sorted(self.requests.items())
+            latency = sorted((key, list(counts)) for key, counts in self.latency.items())
+            latency_sum = dict(self.latency_sum)
+            bytes_sent = sorted(self.bytes_sent.items())
+            spa_fallbacks = self.spa_fallbacks
+            audio_cache = dict(self.audio_cache)
+
+        lines = [
+            "# HELP provinent_http_requests_total Requests handled, by route, method and status.",
+            "# TYPE provinent_http_requests_total counter",
+        ]
+        for (route, method, status), count in requests:
+            lines.append(
+                f'provinent_http_requests_total{{{self.worker},route="{route}",method="{method}",status="{status}"}} {count}'
+            )
+
+        lines += [
+            "# HELP provinent_http_request_duration_seconds Time from request line to response sent.",
+            "# TYPE provinent_http_request_duration_seconds histogram",
+        ]
+        for (route, method), counts in latency:
+            labels = f'{self.worker},route="{route}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                cumulative += count
+                lines.append(
+                    f'provinent_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            cumulative += counts[-1]
+            lines.append(f'provinent_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'provinent_http_request_duration_seconds_sum{{{labels}}} {latency_sum[(route, method)]:.6f}')
+            lines.append(f'provinent_http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += [
+            "# HELP provinent_http_response_bytes_total Response bytes sent, including headers.",
+            "# TYPE provinent_http_response_bytes_total counter",
+        ]
+        for route, count in bytes_sent:
+            lines.append(f'provinent_http_response_bytes_total{{{self.worker},route="{route}"}} {count}')
+
+        lines += [
+            "# HELP provinent_http_spa_fallbacks_total Unknown paths answered with index.html.",
+            "# TYPE provinent_http_spa_fallbacks_total counter",
+            f"provinent_http_spa_fallbacks_total{{{self.worker}}} {spa_fallbacks}",
+            "# HELP provinent_audio_cache_requests_total Chapter audio requests by cache result.",
+            "# TYPE provinent_audio_cache_requests_total counter",
+            f'provinent_audio_cache_requests_total{{{self.worker},result="hit"}} {audio_cache["hit"]}',
+            f'provinent_audio_cache_requests_total{{{self.worker},result="miss"}} {audio_cache["miss"]}',
+            "# HELP provinent_process_start_time_seconds Server start time since the Unix epoch.",
+            "# TYPE provinent_process_start_time_seconds gauge",
+            f"provinent_process_start_time_seconds{{{self.worker}}} {self.started:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class AccessLog:
+    """Access log that writes to stdout from a background thread"""
+
+    def __init__(self, stream=None):
+        self._queue = queue.SimpleQueue()
+        self._logger = logging.getLogger("provinent.access")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        # A forked worker starts its own log; drop the handler inherited from the parent
+        self._logger.handlers.clear()
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = logging.handlers.QueueListener(self._queue, output)
+        self._listener.start()
+
+    def write(self, message):
+        self._logger.info(message)
+
+    def close(self):
+        """Flush pending lines and stop the writer thread"""
+        self._listener.stop()
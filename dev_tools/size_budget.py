@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Asset size tracking and budgets for the Provinent Scripture Study builders
+Records raw/minified/gzip/brotli sizes per output in size-history.json and
+fails the build when an output exceeds its budget in size-budgets.json.
+Builders check budgets before writing, so an over-budget output never
+reaches www/.
+"""
+
+import fnmatch
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+DEV_TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(DEV_TOOLS_DIR, "size-history.json")
+BUDGETS_FILE = os.path.join(DEV_TOOLS_DIR, "size-budgets.json")
+HISTORY_SCHEMA = 1
+HISTORY_LIMIT = 200  # Runs kept in the history file
+METRICS = ('raw', 'minified', 'gzip', 'brotli')
+
+def add_budget_arguments(parser):
+    """Add the size budget options shared by the builders"""
+    parser.add_argument('--skip-budgets', action='store_true',
+                        help='Record sizes but do not fail the build on budget overruns')
+
+def measure(raw_content, output_content):
+    """Return the raw, minified, gzip and brotli sizes of one output"""
+    raw = raw_content.encode('utf-8') if isinstance(raw_content, str) else raw_content
+    output = output_content.encode('utf-8') if isinstance(output_content, str) else output_content
+
+    return {
+        'raw': len(raw),
+        'minified': len(output),
+        'gzip': len(gzip.compress(output, compresslevel=9, mtime=0)),
+        'brotli': len(brotli.compress(output, quality=11)) if brotli else None
+    }
+
+def read_app_version(state_file="../src/modules/state.js"):
+    """Read APP_VERSION from state.js so history entries name the release"""
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            match = re.search(r"APP_VERSION\s*=\s*'([^']+)'", f.read())
+        return match.group(1) if match else None
+    except OSError:
+        return None
+
+def format_kb(size):
+    return "n/a" if size is None else f"{round(size / 1024, 1)}KB"
+
+def format_delta(current, previous):
+    if current is None or previous is None:
+        return ""
+    delta = current - previous
+    if delta == 0:
+        return "\033[90m(=)\033[0m"
+    color = "\033[31m" if delta > 0 else "\033[32m"
+    return f"{color}({'+' if delta > 0 else ''}{delta} B)\033[0m"
+
+class BudgetExceeded(Exception):
+    """Raised by SizeTracker.check() when enforced budgets are exceeded"""
+
+    def __init__(self, failures, budgets_file):
+        self.failures = failures
+        names = ', '.join(asset for asset, *_ in failures)
+        super().__init__(f"Size budget exceeded: {names} (raise the budget in {budgets_file} "
+                         f"or pass --skip-budgets)")
+
+class SizeTracker:
+    """Collects output sizes for one builder run and checks them against budgets"""
+
+    def __init__(self, builder, history_file=HISTORY_FILE, budgets_file=BUDGETS_FILE):
+        self.builder = builder
+        self.history_file = history_file
+        self.budgets_file = budgets_file
+        self.assets = {}
+        self.checked = None
+        self.history = self._load(history_file, {'schema': HISTORY_SCHEMA, 'runs': []})
+        self.config = self._load(budgets_file, {'metric': 'gzip', 'budgets': {}})
+
+    @staticmethod
+    def _load(path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def record(self, asset, raw_content, output_content):
+        """Measure one output; asset is its path relative to www/"""
+        self.assets[asset.replace('\\', '/')] = measure(raw_content, output_content)
+
+    def totals(self):
+        """Sum each metric over assets grouped by extension, e.g. total:js"""
+        totals = {}
+        counts = {}
+        for asset, sizes in self.assets.items():
+            key = f"total:{os.path.splitext(asset)[1].lstrip('.')}"
+            counts[key] = counts.get(key, 0) + 1
+            group = totals.setdefault(key, {metric: 0 for metric in METRICS})
+            for metric in METRICS:
+                if group[metric] is None or sizes[metric] is None:
+                    group[metric] = None
+                else:
+                    group[metric] += sizes[metric]
+
+        # A total over a single file would just repeat that file
+        return {key: group for key, group in totals.items() if counts[key] > 1}
+
+    def previous_sizes(self, asset):
+        """Return the sizes recorded for asset in the most recent run that built it"""
+        for run in reversed(self.history['runs']):
+            if asset in run['assets']:
+                return run['assets'][asset]
+        return None
+
+    def budget_for(self, asset):
+        """Return the budget that applies to asset; exact names win over patterns"""
+        budgets = self.config.get('budgets', {})
+        if asset in budgets:
+            return budgets[asset]
+        for pattern, limit in budgets.items():
+            if fnmatch.fnmatchcase(asset, pattern):
+                return limit
+        return None
+
+    def check(self, enforce=True):
+        """Print the size report and enforce the budgets.
+
+        Call before writing any output: an overrun raises BudgetExceeded so
+        the builder can stop with www/ untouched. Nothing is saved until
+        save(), so the next build is still compared against the last good one.
+        """
+        metric = self.config.get('metric', 'gzip')
+        current = dict(self.assets)
+        current.update(self.totals())
+        failures = []
+
+        print(f"\n\033[33mAsset sizes (budget metric: {metric}):\033[0m")
+        for asset, sizes in current.items():
+            previous = self.previous_sizes(asset)
+            limit = self.budget_for(asset)
+            size = sizes.get(metric)
+
+            status = ""
+            if limit is not None and size is not None:
+                if size > limit:
+                    failures.append((asset, size, limit, previous))
+                    status = f"\033[31mOVER {format_kb(limit)}\033[0m"
+                else:
+                    status = f"\033[90m{round(size / limit * 100)}% of {format_kb(limit)}\033[0m"
+
+            print(f"  \033[36m{asset}\033[0m "
+                  f"raw {format_kb(sizes['raw'])}, min {format_kb(sizes['minified'])}, "
+                  f"gz {format_kb(sizes['gzip'])}, br {format_kb(sizes['brotli'])} "
+                  f"{format_delta(size, previous.get(metric) if previous else None)} {status}")
+
+        if failures:
+            print(f"\n\033[31mSize budget exceeded ({metric}):\033[0m")
+            for asset, size, limit, previous in failures:
+                before = previous.get(metric) if previous else None
+                since = f", previous run {before} B" if before is not None else ""
+                print(f"  - {asset}: {size} B > budget {limit} B (+{size - limit} B over{since})")
+
+            if enforce:
+                raise BudgetExceeded(failures, self.budgets_file)
+
+        self.checked = current
+
+    def save(self):
+        """Add the checked run to the size history; call once the outputs are written"""
+        if self.checked is None:
+            return
+
+        self.history['runs'].append({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'version': read_app_version(),
+            'builder': self.builder,
+            'assets': self.checked
+        })
+        self.history['schema'] = HISTORY_SCHEMA
+        self.history['runs'] = self.history['runs'][-HISTORY_LIMIT:]
+
+        with open(self.history_file, 'w', encoding='utf-8') as f:
+            json.dump(self.history, f, indent=2)
+            f.write('\n')
@@ -0,0 +1,229 @@
+# Delta sync store for study data (highlights and notes) on the dev servers
+# Every highlight or note is its own row with a revision number, so a client
+# sends only what it changed and receives only what changed since its cursor.
+#
+# POST /api/sync
+#   {"library": "default", "cursor": 41,
+#    "changes": [{"kind": "highlight", "key": "John 3:16",
+#                 "value": {"color": "yellow", "timestamp": 1760000000000},
+#                 "base": 12},
+#                {"kind": "note", "key": "default", "value": "# Notes..."},
+#                {"kind": "highlight", "key": "John 3:17", "value": null}]}
+#
+# A null value deletes the item (the row is kept as a tombstone so other
+# clients see the deletion). "base" is optional: when given and the item has
+# moved past that revision, the change is rejected and returned as a conflict.
+#
+# Response:
+#   {"cursor": 44, "more": false,
+#    "applied": [{"kind": ..., "key": ..., "revision": 42}, ...],
+#    "conflicts": [{"kind": ..., "key": ..., "value": ..., "revision": 30}],
+#    "changes": [{"kind": ..., "key": ..., "value": ..., "revision": 43}]}
+
+import json
+import math
+import sqlite3
+import threading
+
+SYNC_ROUTE = "/api/sync"
+
+SYNC_KINDS = ('highlight', 'note')
+MAX_BODY_BYTES = 1024 * 1024
+MAX_CHANGES = 1000   # Changes accepted per request
+PAGE_SIZE = 1000     # Changes returned per response
+MAX_KEY_LENGTH = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS libraries (
+    library TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    library TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    revision INTEGER NOT NULL,
+    PRIMARY KEY (library, kind, key)
+);
+CREATE INDEX IF NOT EXISTS items_by_revision ON items (library, revision);
+"""
+
+
+class SyncError(ValueError):
+    """A sync request the client must fix; reported as 400"""
+
+
+def _finite_float(text):
+    number = float(text)
+    if not math.isfinite(number):
+        raise SyncError(f"Number out of range: {text}")
+    return number
+
+
+def _reject_constant(name):
+    raise SyncError(f"Not a JSON value: {name}")
+
+
+def decode_request(body):
+    """Parse a sync request body.
+
+    NaN, Infinity and overflowing numbers such as 1e999 are rejected, as
+    JavaScript's JSON.parse could not read them back from other clients.
+    """
+    try:
+        return json.loads(body or b'{}', parse_float=_finite_float, parse_constant=_reject_constant)
+    except (json.JSONDecodeError, UnicodeDecodeError, RecursionError):
+        # RecursionError: valid but too deeply nested for the decoder
+        raise SyncError("Request body is not valid JSON") from None
+
+
+class SyncStore:
+    """SQLite-backed item store with per-library revision counters"""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it in WAL mode on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def validate(request):
+        """Check a decoded request body and return (library, cursor, changes)"""
+        if not isinstance(request, dict):
+            raise SyncError("Request body must be a JSON object")
+
+        library = request.get('library', 'default')
+        cursor = request.get('cursor', 0)
+        changes = request.get('changes', [])
+
+        if not isinstance(library, str) or not library or len(library) > MAX_KEY_LENGTH:
+            raise SyncError("Invalid library")
+        if not isinstance(cursor, int) or isinstance(cursor, bool) or cursor < 0:
+            raise SyncError("Invalid cursor")
+        if not isinstance(changes, list):
+            raise SyncError("changes must be a list")
+        if len(changes) > MAX_CHANGES:
+            raise SyncError(f"At most {MAX_CHANGES} changes per request")
+
+        for change in changes:
+            if not isinstance(change, dict):
+                raise SyncError("Each change must be an object")
+            if change.get('kind') not in SYNC_KINDS:
+                raise SyncError(f"Unknown kind: {change.get('kind')!r}")
+            key = change.get('key')
+            if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+                raise SyncError("Invalid key")
+            base = change.get('base', 0)
+            if not isinstance(base, int) or isinstance(base, bool) or base < 0:
+                raise SyncError("Invalid base revision")
+
+        return library, cursor, changes
+
+    def sync(self, request):
+        """Apply a batch of changes and return the deltas since the client's cursor"""
+        library, cursor, changes = self.validate(request)
+        db = self._connect()
+
+        applied = []
+        conflicts = []
+
+        # One write transaction per request, however many changes it carries
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT revision FROM libraries WHERE library = ?", (library,)).fetchone()
+            revision = row[0] if row else 0
+
+            # Later changes to the same item in one batch win
+            latest = {}
+            for change in changes:
+                latest[(change['kind'], change['key'])] = change
+
+            current = {}
+            keys = list(latest)
+            for start in range(0, len(keys), 400):
+                chunk = keys[start:start + 400]
+                placeholders = ','.join('(?, ?)' for _ in chunk)
+                params = [library] + [part for pair in chunk for part in pair]
+                for kind, key, value, item_revision in db.execute(
+                        f"SELECT kind, key, value, revision FROM items "
+                        f"WHERE library = ? AND (kind, key) IN ({placeholders})", params):
+                    current[(kind, key)] = (value, item_revision)
+
+            rows = []
+            for (kind, key), change in latest.items():
+                existing = current.get((kind, key))
+                if 'base' in change and existing and existing[1] > change['base']:
+                    conflicts.append({
+                        'kind': kind, 'key': key,
+                        'value': json.loads(existing[0]) if existing[0] is not None else None,
+                        'revision': existing[1]
+                    })
+                    continue
+
+                value = change.get('value')
+                encoded = json.dumps(value, separators=(',', ':')) if value is not None else None
+                if existing and existing[0] == encoded:
+                    # No-op writes do not bump revisions or wake other clients
+                    applied.append({'kind': kind, 'key': key, 'revision': existing[1]})
+                    continue
+
+                revision += 1
+                rows.append((library, kind, key, encoded, revision))
+                applied.append({'kind': kind, 'key': key, 'revision': revision})
+
+            if rows:
+                db.executemany(
+                    "INSERT INTO items (library, kind, key, value, revision) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (library, kind, key) DO UPDATE SET "
+                    "value = excluded.value, revision = excluded.revision", rows)
+                db.execute(
+                    "INSERT INTO libraries (library, revision) VALUES (?, ?) "
+                    "ON CONFLICT (library) DO UPDATE SET revision = excluded.revision",
+                    (library, revision))
+
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        # The client already has what it just sent, so skip those revisions
+        own = {entry['revision'] for entry in applied}
+        deltas = []
+        more = False
+        rows = db.execute(
+            "SELECT kind, key, value, revision FROM items "
+            "WHERE library = ? AND revision > ? ORDER BY revision LIMIT ?",
+            (library, cursor, PAGE_SIZE + 1)).fetchall()
+        if len(rows) > PAGE_SIZE:
+            more = True
+            rows = rows[:PAGE_SIZE]
+
+        for kind, key, value, item_revision in rows:
+            cursor = item_revision
+            if item_revision in own:
+                continue
+            deltas.append({
+                'kind': kind, 'key': key,
+                'value': json.loads(value) if value is not None else None,
+                'revision': item_revision
+            })
+
+        return {
+            'cursor': cursor,
+            'more': more,
+            'applied': applied,
+            'conflicts': conflicts,
+            'changes': deltas
+        }
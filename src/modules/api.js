@@ -13,6 +13,7 @@ import { bookNameMapping, state, saveToStorage } from './state.js';
 ==================================================================== */
 
 const API_BASE_URL = 'https://bible.helloao.org/api';
+const KJV_AUDIO_BASE_URL = 'https://openbible.com/audio/kjv'; // dev_tools servers mirror this at /audio/kjv
 const AUDIO_TIMEOUT_MS = 10000; // 10 second timeout for audio
 const FETCH_TIMEOUT_MS = 15000; // 15 second timeout for API requests
 
@@ -191,7 +192,7 @@ export function getKJVAudioLink(book, chapter) {
     if (!bookCode) return null;
     
     const paddedChapter = chapter.toString().padStart(3, '0');
-    return `https://openbible.com/audio/kjv/KJV_${bookCode}_${paddedChapter}.mp3`;
+    return `${KJV_AUDIO_BASE_URL}/KJV_${bookCode}_${paddedChapter}.mp3`;
 }
 
 /**
@@ -1,52 +1,184 @@
 /* ====================================================================
   Provinent Scripture Study – sw.js
-  Version‑aware Service Worker
+  Route-table Service Worker
 ==================================================================== */
 
-const CORE_ASSETS = [
-    '/', '/index.html', '/styles.css', '/main.js',
-    '/modules/api.js', '/modules/highlights.js', '/modules/hotkeys.js', 
-    '/modules/mobile.js', '/modules/navigation.js', '/modules/passage.js', 
-    '/modules/settings.js', '/modules/state.js', '/modules/strongs.js', 
-    '/modules/ui.js', '/sw.js', '/404.html', '/manifest.json',
-    '/favicons/apple-touch-icon.png', '/favicons/favicon.png',
-    '/favicons/favicon-16x16.png', '/favicons/favicon-32x32.png',
-    '/favicons/favicon-192x192.png', '/favicons/favicon-512x512.png'
-];
-
-let CURRENT_CACHE = null;   // will become “provinent‑cache‑vX.Y.Z”
-
-self.addEventListener('message', e => {
-    if (e.data?.type === 'VERSION') {
-        CURRENT_CACHE = `provinent-cache-v${e.data.version}`;
-        preCacheCoreAssets();               // fire‑and‑forget
+// Replaced by dev_tools/build-sw.py with the asset revisions and route
+// table of the build. Left empty, every request goes to the network.
+const BUILD = {"version":"dev","precache":[],"routes":[]};
+
+const CACHE_PREFIX = 'provinent-';
+const PRECACHE = 'provinent-precache';
+
+// Precache entries are [path, revision] or [path, revision, [revisions with a patch]]
+const REVISIONS = new Map(BUILD.precache.map(([path, revision]) => [path, revision]));
+const ROUTES = BUILD.routes.map(route => ({
+    ...route,
+    pattern: new RegExp(route.pattern)
+}));
+
+const openCaches = new Map();
+
+/**
+ * Open a cache once per worker instead of once per response.
+ */
+function openCache(name) {
+    if (!openCaches.has(name)) {
+        openCaches.set(name, caches.open(name));
     }
+    return openCaches.get(name);
+}
+
+/**
+ * Precache entries are keyed by path and revision, so an asset whose
+ * content did not change between builds is never downloaded again.
+ */
+function precacheKey(path, revision) {
+    return `${path}?__rev=${revision}`;
+}
+
+async function matchPrecache(path) {
+    const revision = REVISIONS.get(path);
+    if (!revision) return undefined;
+    const cache = await openCache(PRECACHE);
+    return cache.match(precacheKey(path, revision));
+}
+
+self.addEventListener('install', evt => {
+    evt.waitUntil(
+        (async () => {
+            const cache = await openCache(PRECACHE);
+            const stored = new Set(
+                (await cache.keys()).map(req => {
+                    const url = new URL(req.url);
+                    return url.pathname + url.search;
+                })
+            );
+            const missing = BUILD.precache.filter(
+                ([path, revision]) => !stored.has(precacheKey(path, revision))
+            );
+
+            // A failed entry is skipped rather than failing the install;
+            // cache-first falls back to the network for it
+            let patched = 0;
+            let failed = 0;
+            await Promise.all(missing.map(async ([path, revision, patchFrom = []]) => {
+                try {
+                    const older = patchFrom.filter(old => stored.has(precacheKey(path, old)));
+                    let resp = await patchAsset(cache, path, revision, older);
+                    if (resp) {
+                        patched++;
+                    } else {
+                        resp = await fetch(new Request(path, { cache: 'reload', credentials: 'same-origin' }));
+                        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+                    }
+                    await cache.put(precacheKey(path, revision), resp);
+                } catch (err) {
+                    failed++;
+                    console.error(`Pre-cache failed for ${path}, skipping it`, err);
+                }
+            }));
+            console.log(`Build ${BUILD.version}: ${missing.length - failed} of ${BUILD.precache.length} assets updated, ${patched} by patch, ${failed} failed`);
+            await self.skipWaiting();
+        })()
+    );
 });
 
-async function preCacheCoreAssets() {
-    if (!CURRENT_CACHE) return;
-    const cache = await caches.open(CURRENT_CACHE);
-    try {
-        await cache.addAll(
-            CORE_ASSETS.map(u => new Request(u, { credentials: 'same-origin' }))
-        );
-        console.log('Core assets cached under', CURRENT_CACHE);
-    } catch (err) {
-        console.error('Failed to pre‑cache core assets', err);
+/**
+ * Rebuild an asset from the cached copy of an older revision and a delta
+ * patch written by dev_tools/release_patches.py. Returns null when the
+ * full file has to be downloaded instead.
+ */
+async function patchAsset(cache, path, revision, olderRevisions) {
+    for (const old of olderRevisions) {
+        const cached = await cache.match(precacheKey(path, old));
+        if (!cached) continue;
+        try {
+            const patch = await fetch(`/patches/${old}-${revision}.bin`, { cache: 'no-store' });
+            if (!patch.ok) return null;
+            const body = applyPatch(
+                new Uint8Array(await cached.arrayBuffer()),
+                new Uint8Array(await patch.arrayBuffer())
+            );
+            if (await shortHash(body, revision.length) !== revision) return null;
+            const headers = new Headers(cached.headers);
+            headers.delete('content-length');
+            return new Response(body, { status: 200, headers });
+        } catch (err) {
+            console.error(`Patching ${path} failed, downloading it instead`, err);
+            return null;
+        }
+    }
+    return null;
+}
+
+/**
+ * Patch format: 'PVD1', target length, then copy (0x00 offset length) and
+ * insert (0x01 length bytes) operations, all numbers as LEB128 varints.
+ */
+function applyPatch(source, patch) {
+    if (String.fromCharCode(...patch.subarray(0, 4)) !== 'PVD1') {
+        throw new Error('Not a delta patch');
+    }
+    let pos = 4;
+    const varint = () => {
+        let value = 0, scale = 1, byte;
+        do {
+            byte = patch[pos++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        return value;
+    };
+
+    const out = new Uint8Array(varint());
+    let written = 0;
+    while (pos < patch.length) {
+        const op = patch[pos++];
+        if (op === 0) {
+            const start = varint();
+            const length = varint();
+            out.set(source.subarray(start, start + length), written);
+            written += length;
+        } else if (op === 1) {
+            const length = varint();
+            out.set(patch.subarray(pos, pos + length), written);
+            pos += length;
+            written += length;
+        } else {
+            throw new Error(`Unknown patch operation ${op}`);
+        }
     }
+    if (written !== out.length) throw new Error('Patch length mismatch');
+    return out;
 }
 
-self.addEventListener('install', () => self.skipWaiting());
+async function shortHash(bytes, length) {
+    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', bytes));
+    return Array.from(digest, b => b.toString(16).padStart(2, '0')).join('').slice(0, length);
+}
 
 self.addEventListener('activate', evt => {
     evt.waitUntil(
         (async () => {
-            const expected = CURRENT_CACHE ||
-                `provinent-cache-v${self.registration.scope}`;
+            if (self.registration.navigationPreload) {
+                await self.registration.navigationPreload.enable();
+            }
+
+            // Drop asset revisions this build no longer uses
+            const current = new Set(BUILD.precache.map(([path, revision]) => precacheKey(path, revision)));
+            const cache = await openCache(PRECACHE);
+            for (const req of await cache.keys()) {
+                const url = new URL(req.url);
+                if (!current.has(url.pathname + url.search)) await cache.delete(req);
+            }
+
+            // Drop caches of routes that no longer exist (and the old versioned caches)
+            const expected = new Set([PRECACHE, ...ROUTES.map(route => route.cache).filter(Boolean)]);
             const names = await caches.keys();
             await Promise.all(
                 names.map(name =>
-                    name !== expected && name.startsWith('provinent-cache-v')
+                    name.startsWith(CACHE_PREFIX) && !expected.has(name)
                         ? caches.delete(name)
                         : null
                 )
@@ -57,49 +189,136 @@ self.addEventListener('activate', evt => {
 });
 
 self.addEventListener('fetch', evt => {
-    if (evt.request.method !== 'GET') return;
+    const { request } = evt;
+    if (request.method !== 'GET' || !isHttpScheme(request.url)) return;
 
     // ---------- Navigation (full page loads) ----------
-    if (evt.request.mode === 'navigate') {
-        evt.respondWith(
-            fetch(evt.request)
-                .then(resp => {
-                    if (shouldCache(evt.request, resp)) {
-                        const copy = resp.clone();
-                        caches.open(CURRENT_CACHE).then(c => c.put(evt.request, copy));
-                    }
-                    return resp;
-                })
-                .catch(() => caches.match(evt.request).then(c => c || caches.match('/404.html')))
-        );
+    if (request.mode === 'navigate') {
+        evt.respondWith(networkFirstNavigation(evt));
         return;
     }
 
-    // ---------- All other GET requests ----------
-    evt.respondWith(
-        fetch(evt.request)
-            .then(resp => {
-                if (shouldCache(evt.request, resp)) {
-                    const copy = resp.clone();
-                    caches.open(CURRENT_CACHE).then(c => c.put(evt.request, copy));
-                }
-                return resp;
-            })
-            .catch(() => caches.match(evt.request))
-    );
+    // ---------- Build assets ----------
+    const url = new URL(request.url);
+    if (url.origin === self.location.origin && REVISIONS.has(url.pathname)) {
+        evt.respondWith(cacheFirst(request, url.pathname));
+        return;
+    }
+
+    // ---------- Runtime routes ----------
+    const route = ROUTES.find(r => routeMatches(r, url));
+    if (!route) return;
+
+    switch (route.strategy) {
+        case 'stale-while-revalidate':
+            evt.respondWith(staleWhileRevalidate(evt, route));
+            break;
+        case 'network-first':
+            evt.respondWith(networkFirst(request, route));
+            break;
+        default:
+            // network-only: let the browser handle it (e.g. audio range requests)
+            break;
+    }
 });
 
 /**
- * Returns true only for http(s) URLs **and** for responses that are not
- * opaque (cross‑origin no‑cors). Opaque responses cannot be inspected
- * and some browsers reject caching them.
+ * Route origins are 'self', '*' or an exact origin; patterns match the path.
  */
-function shouldCache(request, response) {
-    return (
-        CURRENT_CACHE &&
-        isHttpScheme(request.url) &&
-        response.type !== 'opaque'
-    );
+function routeMatches(route, url) {
+    const origin = route.origin === 'self' ? self.location.origin : route.origin;
+    if (origin !== '*' && url.origin !== origin) return false;
+    return route.pattern.test(url.pathname);
+}
+
+/**
+ * HTML: always ask the network (navigation preload starts that request
+ * while the worker boots), falling back to the cached app shell offline.
+ */
+async function networkFirstNavigation(evt) {
+    try {
+        const preloaded = await evt.preloadResponse;
+        if (preloaded) return preloaded;
+        return await fetch(evt.request);
+    } catch (err) {
+        const path = new URL(evt.request.url).pathname;
+        return (await matchPrecache(path === '/' ? '/index.html' : path)) ||
+            (await matchPrecache('/index.html')) ||
+            (await matchPrecache('/404.html')) ||
+            Response.error();
+    }
+}
+
+/**
+ * Build assets: the cached copy is always current for this build.
+ */
+async function cacheFirst(request, path) {
+    const cached = await matchPrecache(path);
+    if (cached) return cached;
+
+    const resp = await fetch(request);
+    if (shouldCache(resp)) {
+        const cache = await openCache(PRECACHE);
+        await cache.put(precacheKey(path, REVISIONS.get(path)), resp.clone());
+    }
+    return resp;
+}
+
+/**
+ * Chapter data: answer from the cache at once and refresh it behind the
+ * response; only the first visit to a chapter waits for the network.
+ */
+async function staleWhileRevalidate(evt, route) {
+    const cache = await openCache(route.cache);
+    const cached = await cache.match(evt.request);
+
+    const update = fetch(evt.request).then(async resp => {
+        if (shouldCache(resp)) {
+            await cache.put(evt.request, resp.clone());
+            await trimCache(cache, route.maxEntries);
+        }
+        return resp;
+    });
+
+    if (cached) {
+        evt.waitUntil(update.catch(() => null));
+        return cached;
+    }
+    return update;
+}
+
+async function networkFirst(request, route) {
+    const cache = await openCache(route.cache);
+    try {
+        const resp = await fetch(request);
+        if (shouldCache(resp)) {
+            cache.put(request, resp.clone()).then(() => trimCache(cache, route.maxEntries));
+        }
+        return resp;
+    } catch (err) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw err;
+    }
+}
+
+/**
+ * Keep at most maxEntries responses. cache.put() re-appends an entry, so
+ * key order runs from least to most recently stored.
+ */
+async function trimCache(cache, maxEntries) {
+    if (!maxEntries) return;
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(keys.length - maxEntries, 0)).map(key => cache.delete(key)));
+}
+
+/**
+ * Returns true only for complete responses that can be inspected. Opaque
+ * responses (cross‑origin no‑cors) and partial 206 responses are skipped,
+ * as some browsers reject caching them.
+ */
+function shouldCache(response) {
+    return response.status === 200 && response.type !== 'opaque';
 }
 
 /**